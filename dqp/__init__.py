@@ -2,14 +2,23 @@
 
 from dqp.constants import Placeholder, ListPlaceholder
 from dqp.decorators import register_prepared_sql, register_prepared_qs, prepare_sql, prepare_qs
-from dqp.prepared_stmt_controller import execute_stmt
 
 __all__ = [
     "Placeholder",
     "ListPlaceholder",
     "execute_stmt",
+    "execute_stmt_many",
     "register_prepared_sql",
     "register_prepared_qs",
     "prepare_sql",
     "prepare_qs"
 ]
+
+
+def __getattr__(name):
+    # The controller pulls in the django db machinery so only import it when it's actually used.
+    if name in ("execute_stmt", "execute_stmt_many"):
+        from dqp import prepared_stmt_controller
+
+        return getattr(prepared_stmt_controller, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,14 +1,47 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
+import gc
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
 
 from dqp.constants import FailureBehaviour
 
 
+def prepare_on_connect(sender, connection, **kwargs):
+    """
+    Prepared statements only last for the database session so when Django opens a new connection re-prepare all of the
+    statements on it in batches, rather than each statement failing and being re-prepared on its first execution.
+    """
+    from dqp.prepared_stmt_controller import _controller
+
+    if connection.alias == DEFAULT_DB_ALIAS:
+        _controller.reprepare_all(on_fail=FailureBehaviour.WARN)
+
+
 class DQPConfig(AppConfig):
     name = "dqp"
 
     def ready(self):
-        from dqp.prepared_stmt_controller import PreparedStatementController
+        from dqp.prepared_stmt_controller import _controller
+
+        if getattr(settings, "DQP_PREPARE_ON_CONNECT", False):
+            connection_created.connect(prepare_on_connect, dispatch_uid="dqp_prepare_on_connect")
+
+        if getattr(settings, "DQP_LAZY_PREPARE", False):
+            # Statements are generated and prepared when they are first executed.
+            _controller.prepare_all(lazy=True)
+            return
 
-        PreparedStatementController().prepare_all(on_fail=FailureBehaviour.WARN)
+        # Preparing the statements creates lots of short lived objects so don't let the garbage collector pause the
+        # start-up part way through; collect once everything has been prepared instead.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            _controller.prepare_all_batched(on_fail=FailureBehaviour.WARN)
+            gc.collect()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
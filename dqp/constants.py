@@ -1,23 +1,48 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
-from collections import UserList
+import sys
 from enum import Enum
 
 
+# Placeholders are rendered with this prefix when django converts them to strings, e.g. in `LIKE` lookups
+PLACEHOLDER_PREFIX = "dqp.placeholder."
+
+
 class Placeholder:
+    __slots__ = ("name",)
+
     def __init__(self, name):
         if "%" in name:
             raise ValueError("Placeholders cannot contain the % symbol")
-        self.name = name
+        # Interned so that looking the name up in the keyword arguments on execution can match by identity
+        self.name = sys.intern(name)
 
     def __repr__(self):
-        return "dqp.placeholder.{}".format(self.name)
+        return PLACEHOLDER_PREFIX + self.name
+
+
+class ListPlaceholder:
+    """
+    A placeholder for a list of values, e.g. for an `__in` lookup. It behaves as a list containing a single Placeholder
+    so that django will build a lookup for it.
+    """
 
+    __slots__ = ("name",)
 
-class ListPlaceholder(UserList):
     def __init__(self, name):
-        self.name = name
-        self.data = [Placeholder(name)]
+        if "%" in name:
+            raise ValueError("Placeholders cannot contain the % symbol")
+        self.name = sys.intern(name)
+
+    def __iter__(self):
+        yield Placeholder(self.name)
+
+    def __len__(self):
+        return 1
+
+    def __getitem__(self, index):
+        # Supports indexes and slices in the same way as a list
+        return [Placeholder(self.name)][index]
 
 
 class FailureBehaviour(Enum):
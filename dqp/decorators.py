@@ -1,27 +1,40 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
 import hashlib
+import sys
+from functools import lru_cache
 
-from dqp.prepared_stmt_controller import PreparedStatementController
 
-
-def _make_stmt_name(func):
+@lru_cache(maxsize=None)
+def _compute_stmt_name(module, qualname, name):
     """
     Create the prepared query name which is a string up-to 63 characters made up of
     - an underscore
-    - the md5 hash of the <module.function> name
+    - the blake2b hash (16 byte digest) of the <module.qualname> name
     - an underscore
     - up-to 29 characters of the function name
+
+    The name is interned as it is used as a key in the controller's statement dicts.
     """
-    m = hashlib.md5()
-    func_name = func.__name__
-    fully_qualified_name = f"{func.__module__}.{func.__name__}"
-    m.update(bytes(fully_qualified_name, encoding="utf-8"))
+    fully_qualified_name = f"{module}.{qualname}"
+    digest = hashlib.blake2b(fully_qualified_name.encode("utf-8"), digest_size=16).hexdigest()
+    return sys.intern("_" + digest + "_" + name[:29])
+
 
-    stmt_name = "_"
-    stmt_name += m.hexdigest()
-    stmt_name += "_" + func_name[:29]
-    return stmt_name
+def _make_stmt_name(func):
+    """
+    Get the prepared query name for a function. The name is cached by `_compute_stmt_name` so re-decorating a function
+    doesn't recompute the hash.
+    """
+    return _compute_stmt_name(func.__module__, func.__qualname__, func.__name__)
+
+
+def _stmt_name_getter(stmt_name):
+    """
+    Return the function which replaces a decorated function. It is the statement name's `__str__`, a builtin method
+    which returns the statement name and is cheaper to call than an equivalent lambda.
+    """
+    return stmt_name.__str__
 
 
 def register_prepared_sql(func):
@@ -39,9 +52,11 @@ def register_prepared_sql(func):
     rows = execute_stmt(count_trades())
 
     """
+    from dqp.prepared_stmt_controller import _controller
+
     stmt_name = _make_stmt_name(func)
-    PreparedStatementController().register_sql(stmt_name, func)
-    return lambda: stmt_name
+    _controller.register_sql(stmt_name, func)
+    return _stmt_name_getter(stmt_name)
 
 
 def register_prepared_qs(func):
@@ -59,9 +74,11 @@ def register_prepared_qs(func):
     rows = execute_stmt(get_trades(), [1, 2, 3])
 
     """
+    from dqp.prepared_stmt_controller import _controller
+
     stmt_name = _make_stmt_name(func)
-    PreparedStatementController().register_qs(stmt_name, func)
-    return lambda: stmt_name
+    _controller.register_qs(stmt_name, func)
+    return _stmt_name_getter(stmt_name)
 
 
 def prepare_sql(func):
@@ -77,10 +94,12 @@ def prepare_sql(func):
     rows = execute_stmt(count_trades())
 
     """
+    from dqp.prepared_stmt_controller import _controller
+
     stmt_name = _make_stmt_name(func)
-    PreparedStatementController().register_sql(stmt_name, func)
-    PreparedStatementController().prepare_sql_stmt(stmt_name, force=False)
-    return lambda: stmt_name
+    _controller.register_sql(stmt_name, func)
+    _controller.prepare_sql_stmt(stmt_name, force=False)
+    return _stmt_name_getter(stmt_name)
 
 
 def prepare_qs(func):
@@ -96,7 +115,9 @@ def prepare_qs(func):
     rows = execute_stmt(get_trades(), [1, 2, 3])
 
     """
+    from dqp.prepared_stmt_controller import _controller
+
     stmt_name = _make_stmt_name(func)
-    PreparedStatementController().register_qs(stmt_name, func)
-    PreparedStatementController().prepare_qs_stmt(stmt_name, force=False)
-    return lambda: stmt_name
+    _controller.register_qs(stmt_name, func)
+    _controller.prepare_qs_stmt(stmt_name, force=False)
+    return _stmt_name_getter(stmt_name)
@@ -1,13 +1,15 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
 import re
+import sys
 import logging
+from functools import lru_cache
 
 from django.db import transaction
 from django.db import connection, OperationalError
 from psycopg2.errors import InvalidSqlStatementName, ProgrammingError
 
-from dqp.constants import Placeholder, ListPlaceholder, FailureBehaviour
+from dqp.constants import Placeholder, ListPlaceholder, FailureBehaviour, PLACEHOLDER_PREFIX
 from dqp.query import PreparedStmtQuery
 from dqp.queryset import PreparedQuerySqlBuilder, PreparedStatementQuerySet
 
@@ -15,44 +17,112 @@ from dqp.queryset import PreparedQuerySqlBuilder, PreparedStatementQuerySet
 logger = logging.getLogger(__name__)
 
 
-NAMED_PLACEHOLDER_REGEX = re.compile("(%\([\w-]+\)s)")
-PLACEHOLDER_REGEX = re.compile("(%s)")
-IN_REGEX = re.compile("(IN|in|In|iN)[\s]*\(%s\)")
+PLACEHOLDER_REGEX = re.compile(r"(?P<named>%\([\w-]+\)s)|(?P<unnamed>%s)")
+COMMENT_REGEX = re.compile(r"--[^\n]*")
+IN_REGEX = re.compile(r"\bIN\s*\(%s\)", re.IGNORECASE)
+LIKE_ESCAPE_REGEX = re.compile(r"\\(.)")
 
+# The kinds of parameter in a PreparedORMStatement's parameter plan
+PARAM_CONSTANT = 0
+PARAM_PLACEHOLDER = 1
+PARAM_LIKE_PLACEHOLDER = 2
 
-def dictfetchall(cursor):
-    """Return all rows from a cursor as a dict"""
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+@lru_cache(maxsize=64)
+def _placeholders_csv(num_params):
+    """Return a comma separated list of `num_params` unnamed placeholders, e.g. "%s, %s, %s" """
+    return ", ".join(num_params * ["%s"])
+
+
+def dictfetchall(cursor, batch_size=1000):
+    """
+    Return all rows from a cursor as a dict. Rows are fetched in batches so only `batch_size` row tuples are held in
+    memory alongside the dicts being built.
+    """
+    columns = tuple(col[0] for col in cursor.description)
+    results = []
+    rows = cursor.fetchmany(batch_size)
+    while rows:
+        results.extend(dict(zip(columns, row)) for row in rows)
+        rows = cursor.fetchmany(batch_size)
+    return results
+
+
+def _run_in_savepoint(func, *args):
+    """
+    If an SQL statement fails while django is in a transaction it won't run any more SQL statements until the current
+    transaction has been rolled back. When we're in a transaction run `func` in a savepoint so it can be rolled back
+    without affecting the user's transaction. Outside a transaction (i.e. in autocommit mode) a failure doesn't affect
+    anything else so we don't pay for the SAVEPOINT and RELEASE round trips.
+    """
+    if connection.in_atomic_block or not connection.get_autocommit():
+        with transaction.atomic():
+            return func(*args)
+    return func(*args)
 
 
 class PreparedStatement:
+    # Many statements can be registered so don't give each one a __dict__
+    __slots__ = ("name", "input_sql", "num_params", "named_placeholders", "sql", "execute_stmt", "_execute_stmt_b")
+
     def __init__(self, name, sql):
-        self.name = name
+        self.name = sys.intern(name)
         self.input_sql = sql
         self.num_params = 0
         self.named_placeholders = None
         self.sql = ""
+        self.execute_stmt = None
+        self._execute_stmt_b = None
+
+    def prepare(self, on_fail=FailureBehaviour.ERROR, cursor=None):
+        """
+        Prepare the statement in the database. A cursor can be supplied so that many statements can be prepared without
+        opening a new cursor for each one, otherwise a new cursor is used.
+        """
+        if cursor is None:
+            with connection.cursor() as cursor:
+                return self.prepare(on_fail, cursor)
 
-    def prepare(self, on_fail=FailureBehaviour.ERROR):
-        self._prepare_input_sql()
-        self._create_exec_stmt()
+        self.build()
 
         # Check to see if the query has already been prepared in the database. This could be the situation if whatever
         # uses this library is also using connection pooling (e.g. pgbouncer): another process may have prepared the
         # query against this db session.
-        if self._check_stmt_is_prepared():
+        if self._check_stmt_is_prepared(cursor):
             return
 
         try:
-            with connection.cursor() as cursor:
-                cursor.execute("""PREPARE {} AS {}""".format(self.name, self.sql))
+            _run_in_savepoint(self._prepare_stmt, cursor)
         except Exception as e:
             if on_fail == FailureBehaviour.WARN:
                 logger.warning("Could not prepare query: {}".format(e))
             else:
                 raise
 
+    def build(self):
+        """
+        Process the input sql and create the execution statement, ready for the statement to be prepared in the database.
+        """
+        # The input sql never changes so it and the execution statement made from it only need to be created once,
+        # however many times the statement is (re-)prepared.
+        if not self.sql:
+            self._prepare_input_sql()
+        if self.execute_stmt is None:
+            self._create_exec_stmt()
+
+    def rename(self, name):
+        """
+        Change the name of the statement in the database. The statement must be prepared again under its new name, which
+        happens the next time it is executed.
+        """
+        self.name = sys.intern(name)
+        self.execute_stmt = None
+        self.build()
+
+    @property
+    def prepare_sql(self):
+        return "PREPARE {} AS {}".format(self.name, self.sql)
+
     def _prepare_input_sql(self):
         """
         One of the nice features of psycopg2 is the ability to name parameters in the SQL and then supply a dict, e.g:
@@ -81,115 +151,136 @@ class PreparedStatement:
 
         N.B. Mixing named and un-named placeholders is not allowed. Use one or the other.
         """
-        sql = self.input_sql.lower().strip()
-
-        # Remove comments because the SQL is put back together without newlines.
-        sql_lines = sql.splitlines()
-        for i, line in enumerate(sql_lines):
-            if "--" in line:
-                sql_lines[i] = line[:line.index("--")]
-        
-        sql = "\n".join(sql_lines)
+        # Remove comments so that any placeholders in them are not counted. The substring checks are much cheaper than
+        # running the regexes so we only run them when there could be something to match.
+        sql = self.input_sql
+        if "--" in sql:
+            sql = COMMENT_REGEX.sub("", sql)
         sql = sql.strip()
-
-        if sql[-1] == ";":
-            sql = sql[:-1]
-        sql_as_list = sql.split()
+        if sql.endswith(";"):
+            sql = sql[:-1].rstrip()
 
         counter = 0
-        unnamed_params_only = False
-
-        # First look for unnamed placeholders
-        for i, token in enumerate(sql_as_list):
-            match = PLACEHOLDER_REGEX.search(token)
-            if match is not None and len(match.groups()) == 1:
-                counter += 1
-                sql_as_list[i] = PLACEHOLDER_REGEX.sub("${}".format(counter), token)
-
-        if counter > 0:
-            # If we have found un-named placeholders then we don't allow any named placeholders.
-            unnamed_params_only = True
-
-        # Now check for named placeholders
         named_placeholders = []
-        for i, token in enumerate(sql_as_list):
-            match = NAMED_PLACEHOLDER_REGEX.search(token)
-            if match is not None and len(match.groups()) == 1:
-                if unnamed_params_only is True:
+        unnamed_found = False
+
+        def replace_placeholder(match):
+            nonlocal counter, unnamed_found
+            named = match.group("named")
+            if named is not None:
+                if unnamed_found:
+                    raise ProgrammingError("Cannot match named and un-named placeholder values in a prepared statement")
+                named_placeholders.append(named)
+            else:
+                if len(named_placeholders) > 0:
                     raise ProgrammingError("Cannot match named and un-named placeholder values in a prepared statement")
-                placeholder = match.groups()[0]
-                named_placeholders.append(placeholder)
-                counter += 1
-                sql_as_list[i] = NAMED_PLACEHOLDER_REGEX.sub("${}".format(counter), token)
+                unnamed_found = True
+            counter += 1
+            return "${}".format(counter)
+
+        # Replace all the placeholders in a single pass over the sql
+        if "%" in sql:
+            sql = PLACEHOLDER_REGEX.sub(replace_placeholder, sql)
 
         if len(named_placeholders) > 0:
-            self.named_placeholders = named_placeholders
+            # The same placeholder is often used more than once so intern them to share one string per name
+            self.named_placeholders = tuple(map(sys.intern, named_placeholders))
 
         self.num_params = counter
-        sql = " ".join(sql_as_list)
-        sql += ";"
-        self.sql = sql
+        self.sql = sql + ";"
 
     def _create_exec_stmt(self):
         if self.named_placeholders is not None:
-            self.execute_stmt = "".join(["EXECUTE ", self.name, "(", ", ".join(self.named_placeholders), ")"])
+            self.execute_stmt = f"EXECUTE {self.name}({', '.join(self.named_placeholders)})"
         elif self.num_params > 0:
-            self.execute_stmt = "".join(["EXECUTE ", self.name, "(", ", ".join(self.num_params * ["%s"]), ")"])
+            self.execute_stmt = f"EXECUTE {self.name}({_placeholders_csv(self.num_params)})"
         else:
-            self.execute_stmt = "EXECUTE {}".format(self.name)
+            self.execute_stmt = f"EXECUTE {self.name}"
+        # psycopg2 accepts the query as bytes, so encode it once here rather than on every execution.
+        self._execute_stmt_b = self.execute_stmt.encode("utf-8")
 
     def execute(self, qry_args=None):
+        # A statement found already prepared in the database (e.g. by another process using pgbouncer) may never have
+        # been built, so make sure there is an execution statement. This is a no-op once it has been built.
+        self.build()
         try:
-            # We try the execution in its own transaction. This is because if an SQL statement fails while django is
-            # in a transaction it won't run any more SQL statements until the current transaction has been rolled back.
-            # Putting just this line in a transaction allows us to rollback the inner transaction without affecting a
-            # user's transaction outside this code.
-            with transaction.atomic():
-                return self._execute(qry_args)
+            return _run_in_savepoint(self._execute, qry_args)
         except OperationalError as e:
             # Check to see if the error was caused by InvalidSqlStatementName which means that we didn't prepare this
             # statement before attemptiong to execute it. This could be caused by the database session reconnecting.
-            if e.__context__ is not None and e.__context__.__class__ == InvalidSqlStatementName:
-                with transaction.atomic():
-                    if not self._check_stmt_is_prepared():
-                        # Let's try to re-prepare the statement
-                        self.prepare()
-                        # and check again to make sure it worked!
-                        if not self._check_stmt_is_prepared():
-                            raise RuntimeError("Statement {} will not be prepared!".format(self.name))
-                        # ok let's execute the statement. If it fails this time we just let it error out.
-                        return self._execute(qry_args)
-                    else:
-                        # The statement is prepared so the error must be something else. Raise it
-                        raise
-            else:
-                raise
+            if isinstance(e.__context__, InvalidSqlStatementName):
+                # The error tells us the statement isn't prepared so there's no need to check pg_prepared_statements:
+                # re-prepare it and execute again. If it fails this time we just let it error out.
+                return _run_in_savepoint(self._prepare_and_execute, qry_args)
+            raise
+
+    def execute_many(self, qry_args_seq):
+        """
+        Execute the statement once for each set of arguments in `qry_args_seq`, returning a list of the results. All of
+        the executions share one cursor and, in a transaction, one savepoint.
+        """
+        self.build()
+        qry_args_seq = list(qry_args_seq)
+        try:
+            return _run_in_savepoint(self._execute_many, qry_args_seq)
+        except OperationalError as e:
+            if isinstance(e.__context__, InvalidSqlStatementName):
+                return _run_in_savepoint(self._prepare_and_execute_many, qry_args_seq)
+            raise
+
+    def _prepare_and_execute(self, qry_args):
+        self._prepare_stmt()
+        return self._execute(qry_args)
+
+    def _prepare_and_execute_many(self, qry_args_seq):
+        self._prepare_stmt()
+        return self._execute_many(qry_args_seq)
 
     def deallocate(self):
-        if self._check_stmt_is_prepared():
-            try:
-                with connection.cursor() as cursor:
+        with connection.cursor() as cursor:
+            if self._check_stmt_is_prepared(cursor):
+                try:
                     cursor.execute("""DEALLOCATE {}""".format(self.name))
-            except Exception:
-                pass
+                except Exception:
+                    pass
 
-    def _check_stmt_is_prepared(self):
-        with connection.cursor() as cursor:
-            cursor.execute("""select count(*) from pg_prepared_statements where name = %s;""", [self.name])
-            (count,) = cursor.fetchone()
+    def _prepare_stmt(self, cursor=None):
+        if cursor is None:
+            with connection.cursor() as cursor:
+                return self._prepare_stmt(cursor)
+
+        cursor.execute(self.prepare_sql)
+
+    def _check_stmt_is_prepared(self, cursor=None):
+        if cursor is None:
+            with connection.cursor() as cursor:
+                return self._check_stmt_is_prepared(cursor)
+
+        cursor.execute("""select count(*) from pg_prepared_statements where name = %s;""", [self.name])
+        (count,) = cursor.fetchone()
         return count == 1
 
     def _execute(self, args):
         with connection.cursor() as cursor:
-            cursor.execute(self.execute_stmt, args)
+            cursor.execute(self._execute_stmt_b, args)
             return dictfetchall(cursor)
 
+    def _execute_many(self, args_seq):
+        results = []
+        with connection.cursor() as cursor:
+            for args in args_seq:
+                cursor.execute(self._execute_stmt_b, args)
+                results.append(dictfetchall(cursor))
+        return results
+
 
 class PreparedORMStatement(PreparedStatement):
     """
     A wrapper around the PreparedStatement class which takes a django query set and handles preperation and execution of it.
     """
 
+    __slots__ = ("params", "model", "compiled_sql_data", "is_get_qry", "is_count_qry", "_param_plan", "params_required")
+
     def __init__(self, name, qs):
         if not isinstance(qs, PreparedQuerySqlBuilder):
             raise ValueError(
@@ -201,55 +292,95 @@ class PreparedORMStatement(PreparedStatement):
         self.compiled_sql_data = qs.query.compiled_sql_data
         self.is_get_qry = qs.is_get
         self.is_count_qry = qs.is_count_qry
-        self.params_required = any((isinstance(x, Placeholder) or isinstance(x, ListPlaceholder)) for x in self.params)
+        self._param_plan = self._make_param_plan(self.params)
+        self.params_required = any(kind != PARAM_CONSTANT for kind, _ in self._param_plan)
+
+    @staticmethod
+    def _make_param_plan(params):
+        """
+        Work out once how each parameter returned by the django sql compiler is filled in on execution. Returns a list of
+        (kind, value) tuples, one for each parameter:
+        - (PARAM_CONSTANT, value) for a parameter that is constant
+        - (PARAM_PLACEHOLDER, name) for a Placeholder or ListPlaceholder which is replaced by the keyword argument `name`
+        - (PARAM_LIKE_PLACEHOLDER, parts) for a `LIKE` placeholder parameter which has the form of either "%param",
+          "%param%" or "param%". `parts` is a list of (is_name, value) tuples which are joined together on execution,
+          replacing the names with the keyword argument values.
+        """
+        plan = []
+        for p in params:
+            if isinstance(p, (Placeholder, ListPlaceholder)):
+                plan.append((PARAM_PLACEHOLDER, p.name))
+            elif isinstance(p, str) and PLACEHOLDER_PREFIX in p:
+                parts = []
+                for part in p.split("%"):
+                    if len(part) == 0:
+                        parts.append((False, "%"))
+                    else:
+                        # django escapes special characters (e.g. `_`) in the placeholder name for LIKE queries
+                        arg_name = LIKE_ESCAPE_REGEX.sub(r"\1", part[len(PLACEHOLDER_PREFIX) :])
+                        parts.append((True, sys.intern(arg_name)))
+                plan.append((PARAM_LIKE_PLACEHOLDER, parts))
+            else:
+                plan.append((PARAM_CONSTANT, p))
+        return plan
 
     @staticmethod
     def _modify_sql(sql):
         # Change from `field IN (%s)` to use postgres specific `field = ANY(%s)` so we can supply any number of args at
         # execution time. I believe this is safe as django never produces sql with named placeholders.
+        # Every IN term contains "(%s)" so most queries, which don't use IN, can skip the regex.
+        if "(%s)" not in sql:
+            return sql
         return IN_REGEX.sub("= ANY(%s)", sql)
 
     def execute(self, *args, **kwargs):
+        return super().execute(self._make_qry_params(kwargs))
+
+    def execute_many(self, kwargs_seq):
+        """
+        Execute the statement once for each dict of keyword arguments in `kwargs_seq`, returning a list of the results.
+        """
+        return super().execute_many([self._make_qry_params(dict(kwargs)) for kwargs in kwargs_seq])
+
+    def _make_qry_params(self, kwargs):
+        """
+        Build the parameters to execute the statement with from the keyword arguments, which are removed from `kwargs`.
+        """
         if kwargs == {}:
             if self.params_required is True:
                 raise ValueError("Not enough parameters supplied to execute prepared statement")
             elif len(self.params) > 0:
-                return super().execute(self.params)
+                return self.params
             else:
-                return super().execute()
+                return None
 
         # Merge the given keyword arguments with any constant arguments returned by django sql compiler
         qry_params = []
-        for p in self.params:
-            if isinstance(p, Placeholder) or isinstance(p, ListPlaceholder):
+        for kind, value in self._param_plan:
+            if kind == PARAM_CONSTANT:
+                qry_params.append(value)
+            elif kind == PARAM_PLACEHOLDER:
                 # It's a standard placeholder value so replace with the passed in parameter value
-                if p.name not in kwargs:
-                    raise ValueError("Missing parameter {} is required to execute prepared statement".format(p.name))
-                qry_params.append(kwargs[p.name])
-                del kwargs[p.name]
-            elif isinstance(p, str) and "dqp.placeholder." in p:
-                # It's a `LIKE` placeholder parameter and has form of either "%param", "%param%" or "param%"
-                parts = [i if len(i) > 0 else "%" for i in p.split("%")]
-                for i, part in enumerate(parts):
-                    if part == "%":
-                        continue
-
-                    arg_name = part.lstrip("dqp.placeholder.")
-                    if arg_name not in kwargs:
-                        raise ValueError(
-                            "Missing parameter {} is required to execute prepared statement".format(arg_name)
-                        )
-                    # replace the placehollder name with the actual supplied parameter value
-                    parts[i] = kwargs[arg_name]
-                    del kwargs[arg_name]
-                qry_params.append("".join(parts))
+                if value not in kwargs:
+                    raise ValueError("Missing parameter {} is required to execute prepared statement".format(value))
+                qry_params.append(kwargs.pop(value))
             else:
-                # It's a parameter that is constant.
-                qry_params.append(p)
+                # It's a `LIKE` placeholder parameter so replace the placeholder name with the passed in parameter value
+                like_parts = []
+                for is_name, part in value:
+                    if is_name:
+                        if part not in kwargs:
+                            raise ValueError(
+                                "Missing parameter {} is required to execute prepared statement".format(part)
+                            )
+                        like_parts.append(kwargs.pop(part))
+                    else:
+                        like_parts.append(part)
+                qry_params.append("".join(like_parts))
 
         if len(kwargs.keys()) > 0:
             raise ValueError("Unknown parameters supplied for prepared statement: {}".format(" , ".join(kwargs.keys())))
-        return super().execute(qry_params)
+        return qry_params
 
     def _execute(self, qry_args):
         if self.is_count_qry is True:
@@ -271,7 +402,10 @@ class PreparedORMStatement(PreparedStatement):
         else:
             return qs
 
+    def _execute_many(self, args_seq):
+        return [self._execute(args) for args in args_seq]
+
     def _execute_count_qry(self, args):
         with connection.cursor() as cursor:
-            cursor.execute(self.execute_stmt, args)
+            cursor.execute(self._execute_stmt_b, args)
             return cursor.fetchone()[0]
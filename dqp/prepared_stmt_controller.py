@@ -1,5 +1,13 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
+import sys
+from collections import Counter
+from hashlib import blake2b
+from itertools import chain
+from weakref import WeakKeyDictionary
+
+from django.db import connection, transaction
+
 from dqp.constants import FailureBehaviour
 from dqp.exceptions import StatementAlreadyPreparedException, StatementNotPreparedException, StatementNotRegistered
 from dqp.prepared_stmt import PreparedStatement, PreparedORMStatement
@@ -9,102 +17,293 @@ class PreparedStatementController:
 
     __singleton_instance = None
 
-    prepared_statements = {}
-    sql_generating_functions = {}
-    qs_generating_functions = {}
-
     def __new__(cls):
         if cls.__singleton_instance is None:
-            cls.__singleton_instance = object.__new__(cls)
+            instance = object.__new__(cls)
+            instance.prepared_statements = {}
+            instance.sql_statements = {}
+            instance.sql_generating_functions = {}
+            instance.qs_generating_functions = {}
+            # Statements which will be created and prepared the first time they are executed
+            instance.lazy_statements = {}
+            # The statement built from each generating function, so re-preparing (e.g. between tests) doesn't
+            # regenerate and recompile the SQL. Weak keys let functions which are re-registered be garbage collected.
+            instance.built_statements = WeakKeyDictionary()
+            # The number of statement names using each statement, as functions generating the same SQL share one
+            instance.statement_refs = Counter()
+            cls.__singleton_instance = instance
         return cls.__singleton_instance
 
     def destroy(self):
         """
-        Destroy this instance of the singleton (used in tests)
+        Deallocate all statements and forget all registered functions, returning the singleton to its initial state
+        (used in tests)
         """
         self.deallocate_all()
         self.sql_generating_functions = {}
         self.qs_generating_functions = {}
-        self.__singleton_instance = None
-        del self
+        self.lazy_statements = {}
+        self.built_statements = WeakKeyDictionary()
 
     def register_sql(self, stmt_name, func):
         """
         Register a function which generates some SQL to be prepared in the database. The reason we register the function
         and not it's output is so that the functions are only evaulated when actually prepared so in effect they are
-        lazily evaluated.
+        lazily evaluated. The function is only evaluated once: its output is reused if the statement is re-prepared.
         """
-        self.sql_generating_functions[stmt_name] = func
+        self.sql_generating_functions[sys.intern(stmt_name)] = func
 
     def register_qs(self, stmt_name, func):
         """
         Register a function which generates a queryset from which SQL can be generated to be prepared in the database.
+        The function is only evaluated once: its output is reused if the statement is re-prepared.
         """
-        self.qs_generating_functions[stmt_name] = func
+        self.qs_generating_functions[sys.intern(stmt_name)] = func
 
-    def prepare_all(self, force=True, on_fail=FailureBehaviour.ERROR):
+    def prepare_all(self, force=True, on_fail=FailureBehaviour.ERROR, lazy=False):
         """
-        Prepare the SQL output of all registered functions in the database.
+        Prepare the SQL output of all registered functions in the database. If lazy is True then each statement is only
+        generated and prepared the first time it is executed.
         """
-        for stmt_name in self.sql_generating_functions.keys():
-            self.prepare_sql_stmt(stmt_name, force, on_fail)
+        if lazy:
+            for stmt_name in self.sql_generating_functions:
+                self.prepare_sql_stmt(stmt_name, force, lazy=True)
+            for stmt_name in self.qs_generating_functions:
+                self.prepare_qs_stmt(stmt_name, force, lazy=True)
+            return
 
-        for stmt_name in self.qs_generating_functions.keys():
-            self.prepare_qs_stmt(stmt_name, force, on_fail)
+        with connection.cursor() as cursor:
+            for stmt in self._create_all_stmts(force):
+                stmt.prepare(on_fail, cursor)
 
-    def prepare_sql_stmt(self, stmt_name, force, on_fail=FailureBehaviour.ERROR):
+    def prepare_all_batched(self, force=True, on_fail=FailureBehaviour.ERROR, batch_size=100):
         """
-        Prepares an SQL statement in the db. If force is True and the statement is already prepared then it is deallocated
-        and re-prepared, otherwise an error is thrown if a re-preparation is attempted.
+        Prepare the SQL output of all registered functions in the database, sending up-to `batch_size` PREPARE
+        statements to the database in each round trip. If a batch fails then each statement in it is prepared
+        individually so that one bad statement doesn't stop the rest from being prepared.
         """
-        if stmt_name in self.prepared_statements.keys():
-            if not force:
-                raise StatementAlreadyPreparedException(f"Statement {stmt_name} has already been prepared")
+        self._prepare_batched(self._create_all_stmts(force), on_fail, batch_size)
 
-            self.prepared_statements[stmt_name].deallocate()
-            del self.prepared_statements[stmt_name]
+    def reprepare_all(self, on_fail=FailureBehaviour.ERROR, batch_size=100):
+        """
+        Prepare all of the statements that have already been created again, in batches, without regenerating them. This
+        is for a new database session (e.g. after Django reconnects) in which none of the statements are prepared.
+        """
+        self._prepare_batched(self.prepared_statements.values(), on_fail, batch_size)
 
-        if stmt_name not in self.sql_generating_functions:
-            raise StatementNotRegistered("Statement {} has not been registered before preparation".format(stmt_name))
+    def _prepare_batched(self, stmts, on_fail, batch_size):
+        """
+        Prepare the statements in the database, sending up-to `batch_size` PREPARE statements in each round trip.
+        """
+        # Functions which generate the same SQL share a statement which must only be prepared once.
+        stmts = list({id(stmt): stmt for stmt in stmts}.values())
+        # Build every statement, including any that are left out below because they are already prepared (e.g. by
+        # another process sharing the session through pgbouncer), so they can all be executed.
+        for stmt in stmts:
+            stmt.build()
+
+        # Statements which are still prepared (e.g. when re-preparing with force) would make their whole batch fail, so
+        # find them with one lookup and leave them out.
+        if stmts:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "select name from pg_prepared_statements where name = ANY(%s);", [[stmt.name for stmt in stmts]]
+                )
+                prepared_names = {name for (name,) in cursor.fetchall()}
+            stmts = [stmt for stmt in stmts if stmt.name not in prepared_names]
+
+        for i in range(0, len(stmts), batch_size):
+            batch = stmts[i : i + batch_size]
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute("\n".join(stmt.prepare_sql for stmt in batch))
+            except Exception:
+                # PREPARE is not transactional so any statements before the failing one will have been prepared;
+                # prepare() skips statements that are already prepared in the database.
+                with connection.cursor() as cursor:
+                    for stmt in batch:
+                        stmt.prepare(on_fail, cursor)
 
-        stmt_sql = self.sql_generating_functions[stmt_name]()
-        self.prepared_statements[stmt_name] = PreparedStatement(stmt_name, stmt_sql)
-        self.prepared_statements[stmt_name].prepare(on_fail)
+    def prepare_sql_stmt(self, stmt_name, force, on_fail=FailureBehaviour.ERROR, cursor=None, lazy=False):
+        """
+        Prepares an SQL statement in the db. If force is True and the statement is already prepared then it is deallocated
+        and re-prepared (unless its SQL is unchanged), otherwise an error is thrown if a re-preparation is attempted. If
+        lazy is True then the statement is only generated and prepared the first time it is executed.
+        """
+        self._prepare(stmt_name, force, on_fail, cursor, lazy, self.sql_generating_functions, self._create_sql_stmt)
 
-    def prepare_qs_stmt(self, stmt_name, force, on_fail=FailureBehaviour.ERROR):
+    def prepare_qs_stmt(self, stmt_name, force, on_fail=FailureBehaviour.ERROR, cursor=None, lazy=False):
         """
         Prepares an queryset statement in the db. If force is True and the statement is already prepared then it is
-        deallocated and re-prepared, otherwise an error is thrown if a re-preparation is attempted.
+        deallocated and re-prepared (unless its SQL is unchanged), otherwise an error is thrown if a re-preparation is
+        attempted. If lazy is True then the statement is only generated and prepared the first time it is executed.
         """
-        if stmt_name in self.prepared_statements.keys():
-            if not force:
-                raise StatementAlreadyPreparedException(f"Statement {stmt_name} has already been prepared")
+        self._prepare(stmt_name, force, on_fail, cursor, lazy, self.qs_generating_functions, self._create_qs_stmt)
 
-            self.prepared_statements[stmt_name].deallocate()
-            del self.prepared_statements[stmt_name]
+    def _prepare(self, stmt_name, force, on_fail, cursor, lazy, generating_functions, create_stmt):
+        """
+        Prepare a statement using `create_stmt` to create it from its function in `generating_functions`, or if lazy is
+        True mark it to be created and prepared when it is first executed.
+        """
+        if lazy:
+            self._get_generating_function(stmt_name, force, generating_functions)
+            self.lazy_statements[stmt_name] = create_stmt
+            return
+
+        create_stmt(stmt_name, force).prepare(on_fail, cursor)
+
+    def _get_generating_function(self, stmt_name, force, generating_functions):
+        """
+        Get the function registered to generate a statement, first removing the statement if it is already prepared.
+        """
+        func = generating_functions.get(stmt_name)
+
+        # The statement built from the function will be prepared again with exactly the same SQL, so there's no need to
+        # deallocate it: prepare() will find it is still prepared in the database and skip the PREPARE.
+        keep = None if func is None else self.built_statements.get(func)
+        self._remove_prepared_stmt(stmt_name, force, keep)
 
-        if stmt_name not in self.qs_generating_functions:
+        if func is None:
             raise StatementNotRegistered("Statement {} has not been registered before preparation".format(stmt_name))
+        return func
+
+    def _create_all_stmts(self, force):
+        """
+        Create the statements for all registered functions, without preparing them in the db.
+        """
+        create_stmts = chain(
+            ((self._create_sql_stmt, stmt_name) for stmt_name in self.sql_generating_functions),
+            ((self._create_qs_stmt, stmt_name) for stmt_name in self.qs_generating_functions),
+        )
+        return [create_stmt(stmt_name, force) for create_stmt, stmt_name in create_stmts]
+
+    def _create_sql_stmt(self, stmt_name, force):
+        """
+        Create the PreparedStatement for a registered SQL generating function, without preparing it in the db.
+        """
+        func = self._get_generating_function(stmt_name, force, self.sql_generating_functions)
 
-        stmt_qs = self.qs_generating_functions[stmt_name]()
-        self.prepared_statements[stmt_name] = PreparedORMStatement(stmt_name, stmt_qs)
-        self.prepared_statements[stmt_name].prepare(on_fail)
+        built_stmt = self.built_statements.get(func)
+        stmt_sql = func() if built_stmt is None else built_stmt.input_sql
+
+        # If another function generates exactly the same SQL then share its statement rather than preparing the same
+        # query in the database under a second name.
+        stmt = self.sql_statements.get(stmt_sql)
+        if stmt is None:
+            stmt = built_stmt or PreparedStatement(stmt_name, stmt_sql)
+            self.sql_statements[stmt_sql] = stmt
+        elif self.statement_refs[stmt] > 0:
+            # A shared statement is prepared under a name made from its SQL rather than the name of whichever function
+            # was prepared first, so that name can be re-registered with different SQL without clashing with it.
+            shared_name = "_dqp_" + blake2b(stmt_sql.encode("utf-8"), digest_size=8).hexdigest()
+            if stmt.name != shared_name:
+                stmt.deallocate()
+                stmt.rename(shared_name)
+
+        self.built_statements[func] = stmt
+        self.prepared_statements[stmt_name] = stmt
+        self.statement_refs[stmt] += 1
+        return stmt
+
+    def _create_qs_stmt(self, stmt_name, force):
+        """
+        Create the PreparedORMStatement for a registered queryset generating function, without preparing it in the db.
+        """
+        func = self._get_generating_function(stmt_name, force, self.qs_generating_functions)
+
+        stmt = self.built_statements.get(func)
+        if stmt is None:
+            stmt = PreparedORMStatement(stmt_name, func())
+            self.built_statements[func] = stmt
+
+        self.prepared_statements[stmt_name] = stmt
+        self.statement_refs[stmt] += 1
+        return stmt
+
+    def _remove_prepared_stmt(self, stmt_name, force, keep=None):
+        """
+        If a statement has already been prepared then deallocate it if force is True, otherwise raise an error. A
+        statement that is shared with other functions generating the same SQL is only deallocated once it is no longer
+        used by any of them, and the `keep` statement, which is about to be prepared again, is never deallocated.
+        """
+        if not force and stmt_name in self.prepared_statements:
+            raise StatementAlreadyPreparedException(f"Statement {stmt_name} has already been prepared")
+
+        stmt = self.prepared_statements.pop(stmt_name, None)
+        if stmt is None:
+            return
+
+        self.statement_refs[stmt] -= 1
+        if stmt is keep:
+            return
+
+        if self.statement_refs[stmt] > 0:
+            return
+
+        del self.statement_refs[stmt]
+        stmt.deallocate()
+        if self.sql_statements.get(stmt.input_sql) is stmt:
+            del self.sql_statements[stmt.input_sql]
 
     def execute(self, stmt_name, *args, **kwargs):
-        if stmt_name not in self.prepared_statements.keys():
+        stmt = self.prepared_statements.get(stmt_name)
+        if stmt is None:
+            stmt = self._prepare_lazy_stmt(stmt_name)
+
+        return stmt.execute(*args, **kwargs)
+
+    def execute_many(self, stmt_name, params_seq):
+        """
+        Execute a statement once for each set of parameters in `params_seq`, returning a list of the results. For a
+        queryset statement each set of parameters is a dict of the placeholder keyword arguments.
+        """
+        stmt = self.prepared_statements.get(stmt_name)
+        if stmt is None:
+            stmt = self._prepare_lazy_stmt(stmt_name)
+
+        return stmt.execute_many(params_seq)
+
+    def _prepare_lazy_stmt(self, stmt_name):
+        """
+        Create and prepare a statement that was marked to be prepared lazily.
+        """
+        create_stmt = self.lazy_statements.get(stmt_name)
+        if create_stmt is None:
             raise StatementNotPreparedException(f"Statement {stmt_name} has not been prepared prior to execution")
 
-        return self.prepared_statements[stmt_name].execute(*args, **kwargs)
+        stmt = create_stmt(stmt_name, False)
+        del self.lazy_statements[stmt_name]
+        stmt.prepare()
+        return stmt
 
     def deallocate_all(self):
         """
         Deallocate all prepared statements and remove them from the prepared_statements map.
         If the statements are not prepared in the database then it doesn't fail, it just silently moves on.
         """
-        for prep_stmt in self.prepared_statements.values():
-            prep_stmt.deallocate()
+        names = list({stmt.name for stmt in self.prepared_statements.values()})
+        if names:
+            # Find the statements which are actually prepared in this db session, then deallocate them all in one go.
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("select name from pg_prepared_statements where name = ANY(%s);", [names])
+                    prepared_names = [name for (name,) in cursor.fetchall()]
+                    if prepared_names:
+                        cursor.execute("\n".join(f"DEALLOCATE {name};" for name in prepared_names))
+            except Exception:
+                pass
         self.prepared_statements = {}
+        self.sql_statements = {}
+        self.statement_refs = Counter()
+
+
+_controller = PreparedStatementController()
 
 
 def execute_stmt(stmt_name, *args, **kwargs):
-    return PreparedStatementController().execute(stmt_name, *args, **kwargs)
+    return _controller.execute(stmt_name, *args, **kwargs)
+
+
+def execute_stmt_many(stmt_name, params_seq):
+    return _controller.execute_many(stmt_name, params_seq)
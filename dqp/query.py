@@ -20,7 +20,9 @@ class PreparedSQLQuery(Query):
         super().__init__(*args, **kawrgs)
         self.compiled_sql_data = CompiledSQLData()
         self.is_count_qry = False
-        self.placeholder_names = set()
+        # A frozenset which is replaced rather than changed, because cloning a query only makes a shallow copy of its
+        # attributes so a set would be shared between a query and all of its clones.
+        self.placeholder_names = frozenset()
 
     def count(self):
         self.is_count_qry = True
@@ -36,31 +38,33 @@ class PreparedSQLQuery(Query):
         return NoExecutionSQLCompiler(self, connection, using, is_count_qry=self.is_count_qry)
 
     def build_lookup(self, lookups, lhs, rhs):
-        if isinstance(rhs, Placeholder) or isinstance(rhs, ListPlaceholder):
-            if rhs.name in self.placeholder_names:
-                raise NameError(
-                    "Repeated placeholder name: {}. All placeholders in a query must have unique names.".format(
-                        rhs.name
-                    )
-                )
-            self.placeholder_names.add(rhs.name)
-            # Hack - if the rhs is a placeholder then we just want to return the placeholder when the
-            # value is prepared against the lhs field type.
-            _f = lhs.output_field.get_prep_value
-            lhs.output_field.get_prep_value = lambda x: x
-            if hasattr(lhs.output_field, "get_path_info"):
-                _ff = lhs.output_field.get_path_info()[-1].target_fields[-1].get_prep_value
-                lhs.output_field.get_path_info()[-1].target_fields[-1].get_prep_value = lambda x: x
-
-        lookup = super().build_lookup(lookups, lhs, rhs)
-
-        if isinstance(rhs, Placeholder) or isinstance(rhs, ListPlaceholder):
+        if not isinstance(rhs, (Placeholder, ListPlaceholder)):
+            return super().build_lookup(lookups, lhs, rhs)
+
+        if rhs.name in self.placeholder_names:
+            raise NameError(
+                "Repeated placeholder name: {}. All placeholders in a query must have unique names.".format(rhs.name)
+            )
+        self.placeholder_names = self.placeholder_names | {rhs.name}
+        # Hack - if the rhs is a placeholder then we just want to return the placeholder when the
+        # value is prepared against the lhs field type.
+        output_field = lhs.output_field
+        _f = output_field.get_prep_value
+        output_field.get_prep_value = lambda x: x
+        # Resolving the target field walks the relation path so only do it once
+        target_field = None
+        if hasattr(output_field, "get_path_info"):
+            target_field = output_field.get_path_info()[-1].target_fields[-1]
+            _ff = target_field.get_prep_value
+            target_field.get_prep_value = lambda x: x
+
+        try:
+            return super().build_lookup(lookups, lhs, rhs)
+        finally:
             # Restore the get_prep_value functions to their original for the next use (which may not be in a prepared qry)
-            lhs.output_field.get_prep_value = _f
-            if hasattr(lhs.output_field, "get_path_info"):
-                lhs.output_field.get_path_info()[-1].target_fields[-1].get_prep_value = _ff
-
-        return lookup
+            output_field.get_prep_value = _f
+            if target_field is not None:
+                target_field.get_prep_value = _ff
 
     def sql_with_params(self):
         """
@@ -93,13 +97,15 @@ class PreparedStmtQuery(Query):
         # django-cachalot doesn't like params to be None so use an empty iterable instead
         self.params = params or ()
         self.compiled_sql_data = compiled_sql_data
+        # The statement and parameters never change so build the pair returned by sql_with_params() once.
+        self._sql_with_params = (self.exec_stmt, self.params)
 
     def sql_with_params(self):
         """
         Return the query as an SQL string and the parameters that will be
         substituted into the query.
         """
-        return (self.exec_stmt, self.params)
+        return self._sql_with_params
 
     def get_compiler(self, using=None, connection=None):
         """
@@ -2,10 +2,11 @@
 
 from collections import namedtuple
 from copy import deepcopy
+from operator import attrgetter
 
 from django.db.models.query import QuerySet
 
-from dqp.constants import Placeholder
+from dqp.constants import Placeholder, ListPlaceholder
 from dqp.exceptions import (
     PreparedQueryNotSupported,
     CannotAlterPreparedStatementQuerySet,
@@ -31,50 +32,44 @@ class PreparedQuerySetBase(QuerySet):
     def last(self):
         raise NotImplementedError
 
-    # Methods that are not available for prepared querysets
+    # Methods that are not available for prepared querysets are added below
 
     NotSupportedMessage = (
         "Cannot use {} with prepared querysets. Please use an ordinary ORM queryset or use SQL for the prepared query."
     )
 
-    def aggregate(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("aggregate"))
 
-    def in_bulk(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("in_bulk"))
-
-    def create(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("create"))
-
-    def bulk_create(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("bulk_create"))
-
-    def bulk_update(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("bulk_update"))
-
-    def get_or_create(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("get_or_create"))
-
-    def update_or_create(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("update_or_create"))
-
-    def delete(self):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("delete"))
-
-    def update(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("update"))
-
-    def exists(self):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("exists"))
-
-    def explain(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("explain"))
-
-    def iterator(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("iterator"))
-
-    def select_for_update(self, *args, **kwargs):
-        raise PreparedQueryNotSupported(self.NotSupportedMessage.format("select_for_update"))
+def _make_not_supported(name):
+    """
+    Create a method which raises PreparedQueryNotSupported. The message is formatted once here rather than on every call.
+    """
+    message = PreparedQuerySetBase.NotSupportedMessage.format(name)
+
+    def not_supported(self, *args, **kwargs):
+        raise PreparedQueryNotSupported(message)
+
+    not_supported.__name__ = name
+    not_supported.__qualname__ = f"PreparedQuerySetBase.{name}"
+    return not_supported
+
+
+for _name in (
+    "aggregate",
+    "in_bulk",
+    "create",
+    "bulk_create",
+    "bulk_update",
+    "get_or_create",
+    "update_or_create",
+    "delete",
+    "update",
+    "exists",
+    "explain",
+    "iterator",
+    "select_for_update",
+):
+    setattr(PreparedQuerySetBase, _name, _make_not_supported(_name))
+del _name
 
 
 class PreparedQuerySqlBuilder(PreparedQuerySetBase):
@@ -88,11 +83,14 @@ class PreparedQuerySqlBuilder(PreparedQuerySetBase):
         super().__init__(model, query, using, hints)
         self.is_get = False
         self.is_count_qry = False
+        self._repr = None
 
     def __repr__(self):
-        sql, params = self.sql_with_params()
-        params = tuple([("%s" if p == Placeholder else p) for p in params])
-        return sql % params
+        # Querysets are cloned rather than changed so the SQL can't change once it has been generated.
+        if self._repr is None:
+            sql, params = self.sql_with_params()
+            self._repr = sql % tuple("%s" if isinstance(p, (Placeholder, ListPlaceholder)) else p for p in params)
+        return self._repr
 
     def _fetch_all(self):
         """ _fetch_all does nothing: the PreparedQuerySqlBuilder only builds the sql, it cannot execute it. """
@@ -153,6 +151,10 @@ class PreparedStatementQuerySet(PreparedQuerySetBase):
         if self._result_cache is None:
             self._result_cache = list(self._iterable_class(self))
 
+    def _require_executed(self):
+        if self._result_cache is None:
+            raise PreparedStatementNotYetExecuted("You must call `execute()` on the PreparedStatementQuerySet first.")
+
     def prefetch_related(self, *arg, **kwargs):
         """
         Adding a prefetch_related to this class causes an immediate db lookup and returns a new instance of the queryset.
@@ -163,29 +165,25 @@ class PreparedStatementQuerySet(PreparedQuerySetBase):
         return clone
 
     def count(self):
-        if self._result_cache is None:
-            raise PreparedStatementNotYetExecuted("You must call `execute()` on the PreparedStatementQuerySet first.")
+        self._require_executed()
         return len(self._result_cache)
 
     def first(self):
-        if self._result_cache is None:
-            raise PreparedStatementNotYetExecuted("You must call `execute()` on the PreparedStatementQuerySet first.")
-        if len(self._result_cache) > 0:
+        self._require_executed()
+        if self._result_cache:
             return self._result_cache[0]
         else:
             return None
 
     def last(self):
-        if self._result_cache is None:
-            raise PreparedStatementNotYetExecuted("You must call `execute()` on the PreparedStatementQuerySet first.")
-        if len(self._result_cache) > 0:
+        self._require_executed()
+        if self._result_cache:
             return self._result_cache[-1]
         else:
             return None
 
     def reverse(self, *args, **kwargs):
-        if self._result_cache is None:
-            raise PreparedStatementNotYetExecuted("You must call `execute()` on the PreparedStatementQuerySet first.")
+        self._require_executed()
         
         clone = self._chain()
         clone._result_cache = deepcopy(self._result_cache)
@@ -193,8 +191,7 @@ class PreparedStatementQuerySet(PreparedQuerySetBase):
         return clone
 
     def values_list(self, *fields, flat=False, named=False):
-        if self._result_cache is None:
-            raise PreparedStatementNotYetExecuted("You must call `execute()` on the PreparedStatementQuerySet first.")
+        self._require_executed()
 
         if flat and named:
             raise TypeError("'flat' and 'named' can't be used together.")
@@ -205,17 +202,26 @@ class PreparedStatementQuerySet(PreparedQuerySetBase):
         clone = self._chain()
 
         if flat is True:
-            clone._result_cache = [getattr(i, fields[0]) for i in self._result_cache]
-        elif named is True:
+            clone._result_cache = list(map(attrgetter(fields[0]), self._result_cache))
+            return clone
+
+        # attrgetter fetches all of the fields in one call but only returns a tuple when given more than one field
+        if len(fields) > 1:
+            getter = attrgetter(*fields)
+        else:
+
+            def getter(obj):
+                return tuple(getattr(obj, field) for field in fields)
+
+        if named is True:
             Row = namedtuple("Row", fields)
-            clone._result_cache = [Row(*[getattr(i, j) for j in fields]) for i in self._result_cache]
+            clone._result_cache = list(map(Row._make, map(getter, self._result_cache)))
         else:
-            clone._result_cache = [tuple(getattr(i, j) for j in fields) for i in self._result_cache]
+            clone._result_cache = list(map(getter, self._result_cache))
         return clone
 
     def values(self, *fields, **kawrgs):
-        if self._result_cache is None:
-            raise PreparedStatementNotYetExecuted("You must call `execute()` on the PreparedStatementQuerySet first.")
+        self._require_executed()
 
         clone = self._chain()
 
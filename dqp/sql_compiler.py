@@ -3,20 +3,23 @@
 from django.db.models.expressions import Col
 from django.db.models.sql.compiler import SQLCompiler
 
-from dataclasses import dataclass
 
-
-@dataclass
 class CompiledSQLData:
     """
     Holds information about the compiled SQL that is determined when preparing the SQL but needs to be known on execution.
     """
 
-    col_count = 0
-    has_extra_select = False
-    select = None
-    klass_info = None
-    annotation_col_map = None
+    __slots__ = ("col_count", "has_extra_select", "select", "klass_info", "annotation_col_map")
+
+    def __init__(self, col_count=0, has_extra_select=False, select=None, klass_info=None, annotation_col_map=None):
+        self.col_count = col_count
+        self.has_extra_select = has_extra_select
+        self.select = select
+        self.klass_info = klass_info
+        self.annotation_col_map = annotation_col_map
+
+    def __repr__(self):
+        return "CompiledSQLData({})".format(", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__))
 
 
 class NoExecutionSQLCompiler(SQLCompiler):
@@ -70,4 +73,4 @@ class PreparedStmtCompiler(SQLCompiler):
         self.annotation_col_map = compiled_sql_data.annotation_col_map
 
     def as_sql(self, *args, **kwargs):
-        return self.query.exec_stmt, self.query.params
+        return self.query._sql_with_params
@@ -1,6 +1,6 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
-from dqp.prepared_stmt_controller import PreparedStatementController
+from dqp.prepared_stmt_controller import _controller
 
 
 class PrepStmtTestMixin:
@@ -10,13 +10,15 @@ class PrepStmtTestMixin:
 
     @classmethod
     def setUp(cls):
-        PreparedStatementController().deallocate_all()
-        PreparedStatementController().prepare_all(force=True)
+        prepare_all()
 
 
 def prepare_all():
     """
     Re-prepare all prepared queries. Call this at the start of every pytest function.
+
+    The statements are deallocated and then each one is prepared again the first time it is executed, so a test only
+    pays for the statements it uses. The SQL generated for each statement is reused so it isn't compiled again.
     """
-    PreparedStatementController().deallocate_all()
-    PreparedStatementController().prepare_all()
+    _controller.deallocate_all()
+    _controller.prepare_all(lazy=True)
@@ -0,0 +1,39 @@
+# Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
+
+from dqp.prepared_stmt_controller import PreparedStatementController
+
+
+class RestoreRegisteredStmtsMixin:
+    """
+    Once all the tests in a class have run, forget the functions registered by the class and deallocate their
+    statements so that they don't leak into the test classes which follow. Functions that were registered before the
+    class ran (e.g. when another module was imported) are registered again and prepared lazily.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        psc = PreparedStatementController()
+        cls._registered_sql = dict(psc.sql_generating_functions)
+        cls._registered_qs = dict(psc.qs_generating_functions)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        psc = PreparedStatementController()
+        restore = [
+            (psc.sql_generating_functions, cls._registered_sql, psc.prepare_sql_stmt),
+            (psc.qs_generating_functions, cls._registered_qs, psc.prepare_qs_stmt),
+        ]
+        for generating_functions, registered, prepare in restore:
+            for stmt_name, func in list(generating_functions.items()):
+                if registered.get(stmt_name) is func:
+                    continue
+
+                psc._remove_prepared_stmt(stmt_name, force=True)
+                psc.lazy_statements.pop(stmt_name, None)
+                del generating_functions[stmt_name]
+
+                if stmt_name in registered:
+                    generating_functions[stmt_name] = registered[stmt_name]
+                    prepare(stmt_name, force=True, lazy=True)
+        super().tearDownClass()
@@ -0,0 +1,85 @@
+# Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
+
+from unittest.mock import patch
+
+from django.apps import apps
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from dqp.prepared_stmt_controller import PreparedStatementController, execute_stmt
+
+
+class DQPConfigTestMixin:
+    """
+    Run ready() with only the statements registered by the test, so that the statements registered by the rest of the
+    test suite are left as they were.
+    """
+
+    psc = PreparedStatementController()
+
+    def setUp(self):
+        super().setUp()
+        for generating_functions in (self.psc.sql_generating_functions, self.psc.qs_generating_functions):
+            patcher = patch.dict(generating_functions, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def register_sql(self, stmt_name, func):
+        self.psc.register_sql(stmt_name, func)
+        self.addCleanup(self.psc.lazy_statements.pop, stmt_name, None)
+        self.addCleanup(self.psc._remove_prepared_stmt, stmt_name, force=True)
+
+    @staticmethod
+    def _is_prepared_in_db(stmt_name):
+        with connection.cursor() as cursor:
+            cursor.execute("select exists(select 1 from pg_prepared_statements where name = %s);", [stmt_name])
+            (exists,) = cursor.fetchone()
+        return exists
+
+
+class TestLazyPrepare(DQPConfigTestMixin, TestCase):
+    @override_settings(DQP_LAZY_PREPARE=True)
+    def test_ready_lazy_prepare(self):
+        """
+        Given a function generating some SQL has been registered
+        And   DQP_LAZY_PREPARE is True
+        When  ready() is called
+        Then  the statement will not be prepared
+        When  the statement is executed
+        Then  the statement will be prepared in the database
+        """
+        self.register_sql("lazy_select_one", lambda: "select 1 as one_lazy;")
+
+        apps.get_app_config("dqp").ready()
+
+        self.assertFalse("lazy_select_one" in self.psc.prepared_statements)
+        self.assertFalse(self._is_prepared_in_db("lazy_select_one"))
+
+        self.assertEqual(execute_stmt("lazy_select_one"), [{"one_lazy": 1}])
+
+        self.assertTrue("lazy_select_one" in self.psc.prepared_statements)
+        self.assertTrue(self._is_prepared_in_db("lazy_select_one"))
+
+
+class TestPrepareOnConnect(DQPConfigTestMixin, TransactionTestCase):
+    @override_settings(DQP_PREPARE_ON_CONNECT=True)
+    def test_ready_prepare_on_connect(self):
+        """
+        Given a function generating some SQL has been registered
+        And   DQP_PREPARE_ON_CONNECT is True
+        When  ready() is called
+        And   Django opens a new connection to the database
+        Then  the statement will be prepared on the new connection before it is executed
+        """
+        self.register_sql("on_connect_select_one", lambda: "select 1 as one_on_connect;")
+
+        apps.get_app_config("dqp").ready()
+        self.addCleanup(connection_created.disconnect, dispatch_uid="dqp_prepare_on_connect")
+        self.assertTrue(self._is_prepared_in_db("on_connect_select_one"))
+
+        connection.close()
+        connection.ensure_connection()
+
+        self.assertTrue(self._is_prepared_in_db("on_connect_select_one"))
+        self.assertEqual(execute_stmt("on_connect_select_one"), [{"one_on_connect": 1}])
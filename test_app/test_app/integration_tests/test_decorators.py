@@ -7,10 +7,20 @@ from dqp.decorators import register_prepared_sql, prepare_sql, register_prepared
 from dqp.prepared_stmt import PreparedStatement, PreparedORMStatement
 from dqp.prepared_stmt_controller import PreparedStatementController
 
+from test_app.integration_tests.mixins import RestoreRegisteredStmtsMixin
 from test_app.models import Species
 
 
-class TestDecorators(TestCase):
+class TestDecorators(RestoreRegisteredStmtsMixin, TestCase):
+    psc = PreparedStatementController()
+
+    @staticmethod
+    def _is_prepared_in_db(stmt_name):
+        with connection.cursor() as cursor:
+            cursor.execute("select exists(select 1 from pg_prepared_statements where name = %s);", [stmt_name])
+            (exists,) = cursor.fetchone()
+        return exists
+
     def test_register_prepared_sql(self):
         """
         Given a function has been decorated with the register_prepared_sql decorator
@@ -27,17 +37,12 @@ class TestDecorators(TestCase):
             # By raising an error we can ensure that the function isn't evaluated in the course of the test
             raise RuntimeError
 
-        self.assertEqual(some_sql(), "_2c92c76bbf544811d4ae82fa48601635_some_sql")
-        self.assertTrue(some_sql() in PreparedStatementController.sql_generating_functions)
-        self.assertFalse(some_sql() in PreparedStatementController.qs_generating_functions)
-        self.assertFalse(some_sql() in PreparedStatementController.prepared_statements)
+        self.assertEqual(some_sql(), "_3cfcc5ceb0e7e8ee1ad41dc9625bfe6e_some_sql")
+        self.assertTrue(some_sql() in self.psc.sql_generating_functions)
+        self.assertFalse(some_sql() in self.psc.qs_generating_functions)
+        self.assertFalse(some_sql() in self.psc.prepared_statements)
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "select count(*) from pg_prepared_statements where name = '_2c92c76bbf544811d4ae82fa48601635_some_sql';"
-            )
-            (count,) = cursor.fetchone()
-        self.assertEqual(count, 0)
+        self.assertFalse(self._is_prepared_in_db("_3cfcc5ceb0e7e8ee1ad41dc9625bfe6e_some_sql"))
 
     def test_prepare_sql(self):
         """
@@ -54,19 +59,14 @@ class TestDecorators(TestCase):
         def select_now():
             return "select now();"
 
-        self.assertEqual(select_now(), "_d25f81ebea3a1e8f7580d401326909ba_select_now")
-        self.assertTrue(select_now() in PreparedStatementController.sql_generating_functions)
-        self.assertFalse(select_now() in PreparedStatementController.qs_generating_functions)
-        self.assertTrue(select_now() in PreparedStatementController.prepared_statements)
-        self.assertTrue(isinstance(PreparedStatementController.prepared_statements[select_now()], PreparedStatement))
-        self.assertEqual(PreparedStatementController.prepared_statements[select_now()].sql, "select now();")
+        self.assertEqual(select_now(), "_4b9c4a71d15e5b295e5124b3aa87b09e_select_now")
+        self.assertTrue(select_now() in self.psc.sql_generating_functions)
+        self.assertFalse(select_now() in self.psc.qs_generating_functions)
+        self.assertTrue(select_now() in self.psc.prepared_statements)
+        self.assertTrue(isinstance(self.psc.prepared_statements[select_now()], PreparedStatement))
+        self.assertEqual(self.psc.prepared_statements[select_now()].sql, "select now();")
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "select count(*) from pg_prepared_statements where name = '_d25f81ebea3a1e8f7580d401326909ba_select_now';"
-            )
-            (count,) = cursor.fetchone()
-        self.assertEqual(count, 1)
+        self.assertTrue(self._is_prepared_in_db("_4b9c4a71d15e5b295e5124b3aa87b09e_select_now"))
 
     def test_register_prepared_qs(self):
         """
@@ -84,17 +84,12 @@ class TestDecorators(TestCase):
             # By raising an error we can ensure that the function isn't evaluated in the course of the test
             raise RuntimeError
 
-        self.assertEqual(an_orm_query(), "_2e107bfe8f35cb362fc644228c8b2df0_an_orm_query")
-        self.assertFalse(an_orm_query() in PreparedStatementController.sql_generating_functions)
-        self.assertTrue(an_orm_query() in PreparedStatementController.qs_generating_functions)
-        self.assertFalse(an_orm_query() in PreparedStatementController.prepared_statements)
+        self.assertEqual(an_orm_query(), "_6c3c8ce8a90637a21ad7593b1593881f_an_orm_query")
+        self.assertFalse(an_orm_query() in self.psc.sql_generating_functions)
+        self.assertTrue(an_orm_query() in self.psc.qs_generating_functions)
+        self.assertFalse(an_orm_query() in self.psc.prepared_statements)
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "select count(*) from pg_prepared_statements where name = '_2e107bfe8f35cb362fc644228c8b2df0_an_orm_query';"
-            )
-            (count,) = cursor.fetchone()
-        self.assertEqual(count, 0)
+        self.assertFalse(self._is_prepared_in_db("_6c3c8ce8a90637a21ad7593b1593881f_an_orm_query"))
 
     def test_prepare_qs(self):
         """
@@ -111,21 +106,14 @@ class TestDecorators(TestCase):
         def all_species():
             return Species.prepare.all()
 
-        self.assertEqual(all_species(), "_32c1534968813a46e5391e9b19cbcc75_all_species")
-        self.assertFalse(all_species() in PreparedStatementController.sql_generating_functions)
-        self.assertTrue(all_species() in PreparedStatementController.qs_generating_functions)
-        self.assertTrue(all_species() in PreparedStatementController.prepared_statements)
-        self.assertTrue(
-            isinstance(PreparedStatementController.prepared_statements[all_species()], PreparedORMStatement)
-        )
+        self.assertEqual(all_species(), "_13a9d1361d07ee2e7215e5a13ebaa8d9_all_species")
+        self.assertFalse(all_species() in self.psc.sql_generating_functions)
+        self.assertTrue(all_species() in self.psc.qs_generating_functions)
+        self.assertTrue(all_species() in self.psc.prepared_statements)
+        self.assertTrue(isinstance(self.psc.prepared_statements[all_species()], PreparedORMStatement))
         self.assertEqual(
-            PreparedStatementController.prepared_statements[all_species()].sql,
-            """select "test_app_species"."id", "test_app_species"."name" from "test_app_species";""",
+            self.psc.prepared_statements[all_species()].sql,
+            """SELECT "test_app_species"."id", "test_app_species"."name" FROM "test_app_species";""",
         )
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "select count(*) from pg_prepared_statements where name = '_32c1534968813a46e5391e9b19cbcc75_all_species';"
-            )
-            (count,) = cursor.fetchone()
-        self.assertEqual(count, 1)
+        self.assertTrue(self._is_prepared_in_db("_13a9d1361d07ee2e7215e5a13ebaa8d9_all_species"))
@@ -1,26 +1,51 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
+from django.core.exceptions import FieldError
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from django.test import TestCase
 
-from dqp import execute_stmt, Placeholder, ListPlaceholder
+from dqp import execute_stmt, execute_stmt_many, Placeholder, ListPlaceholder
 from dqp.prepared_stmt_controller import PreparedStatementController
 from dqp.queryset import PreparedStatementQuerySet
 from dqp.exceptions import CannotAlterPreparedStatementQuerySet, PreparedQueryNotSupported
 
+from test_app.integration_tests.mixins import RestoreRegisteredStmtsMixin
 from test_app.models import Species, Animal, Items
 
 
-class TestORMQueries(TestCase):
+def species_by_pk():
+    return Species.prepare.order_by("pk")
+
+
+def species_by_name():
+    return Species.prepare.filter(name=Placeholder("name"))
+
+
+class TestORMQueries(RestoreRegisteredStmtsMixin, TestCase):
+    psc = PreparedStatementController()
+
     @classmethod
     def setUpTestData(cls):
-        cls.tiger = Species(name="Tiger")
-        cls.tiger.save()
-        cls.carp = Species(name="Carp")
-        cls.carp.save()
-        cls.crow = Species(name="Crow")
-        cls.crow.save()
+        cls.tiger, cls.carp, cls.crow = Species.objects.bulk_create(
+            [Species(name="Tiger"), Species(name="Carp"), Species(name="Crow")]
+        )
+        cls.tigger, cls.jackdaw, cls.corvid, cls.koi = Animal.objects.bulk_create(
+            [
+                Animal(name="Tigger", species=cls.tiger),
+                Animal(name="Jack Daw", species=cls.crow),
+                Animal(name="C. Orvid", species=cls.crow),
+                Animal(name="Koi", species=cls.carp),
+            ]
+        )
+
+        # Many of the tests only need a query for all the species, or the species with a given name, so prepare them
+        # once for all of them. Prepared statements aren't rolled back with the test transactions so they stay prepared
+        # for every test.
+        cls.psc.register_qs("species_by_pk", species_by_pk)
+        cls.psc.prepare_qs_stmt("species_by_pk", force=True)
+        cls.psc.register_qs("species_by_name", species_by_name)
+        cls.psc.prepare_qs_stmt("species_by_name", force=True)
 
     def test_prepare_all(self):
         """
@@ -32,8 +57,8 @@ class TestORMQueries(TestCase):
         def all_species():
             return Species.prepare.all().order_by("pk")
 
-        PreparedStatementController().register_qs("all_species", all_species)
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
+        self.psc.register_qs("all_species", all_species)
+        self.psc.prepare_qs_stmt("all_species", force=True)
 
         qs = execute_stmt("all_species")
 
@@ -49,20 +74,26 @@ class TestORMQueries(TestCase):
         When  the prepared statement is executed with a keyword argument for the filter
         Then  only the records which match the filter will be returned in a query set
         """
-
-        def filter_species():
-            return Species.prepare.filter(name=Placeholder("name"))
-
-        PreparedStatementController().register_qs("filter_species", filter_species)
-        PreparedStatementController().prepare_qs_stmt("filter_species", force=True)
-
-        qs = execute_stmt("filter_species", name="Carp")
+        qs = execute_stmt("species_by_name", name="Carp")
 
         self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
         self.assertEqual(len(qs), 1)
         self.assertTrue(isinstance(qs[0], Species))
         self.assertEqual(qs[0].name, self.carp.name)
 
+    def test_prepare_filter_execute_many(self):
+        """
+        Given an ORM query is prepared with a filter
+        And   the filter is a Placeholder
+        When  the prepared statement is executed with execute_stmt_many and a list of keyword arguments
+        Then  a list of query sets will be returned, one for each set of keyword arguments
+        """
+        results = execute_stmt_many("species_by_name", [{"name": "Carp"}, {"name": "Shark"}, {"name": "Crow"}])
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(qs, PreparedStatementQuerySet) for qs in results))
+        self.assertEqual([[s.name for s in qs] for qs in results], [["Carp"], [], ["Crow"]])
+
     def test_related_id_filter(self):
         """
         Given an ORM query is prepared with a filter on the id of a related model
@@ -71,23 +102,16 @@ class TestORMQueries(TestCase):
         And   the filter is a related model id
         Then  only the records which match the filter will be returned in a query set
         """
-        Animal.objects.update_or_create(name="Tigger", species=self.tiger)
-        Animal.objects.update_or_create(name="Jack Daw", species=self.crow)
-        Animal.objects.update_or_create(name="C. Orvid", species=self.crow)
-        Animal.objects.update_or_create(name="Koi", species=self.carp)
-
         def filter_animals():
             return Animal.prepare.filter(species_id=Placeholder("species_id")).order_by("id")
 
-        PreparedStatementController().register_qs("filter_animals", filter_animals)
-        PreparedStatementController().prepare_qs_stmt("filter_animals", force=True)
+        self.psc.register_qs("filter_animals", filter_animals)
+        self.psc.prepare_qs_stmt("filter_animals", force=True)
 
         qs = execute_stmt("filter_animals", species_id=self.crow.id)
 
         self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
-        self.assertEqual(len(qs), 2)
-        self.assertEqual(qs[0].name, "Jack Daw")
-        self.assertEqual(qs[1].name, "C. Orvid")
+        self.assertEqual([row.name for row in qs], ["Jack Daw", "C. Orvid"])
 
     def test_doubly_related_id_filter(self):
         """
@@ -97,28 +121,25 @@ class TestORMQueries(TestCase):
         And the filter is related by two foreign keys
         Then  only the records which match the filter will be returned in a query set
         """
-        a1 = Animal.objects.create(name="Jack Daw", species=self.crow)
-        a2 = Animal.objects.create(name="C. Orvid", species=self.crow)
-        a3 = Animal.objects.create(name="Tigger", species=self.tiger)
-
-        Items.objects.update_or_create(description="bird cage", animal=a1)
-        Items.objects.update_or_create(description="whistle", animal=a1)
-        Items.objects.update_or_create(description="bag of seeds", animal=a2)
-        Items.objects.update_or_create(description="honey", animal=a3)
+        Items.objects.bulk_create(
+            [
+                Items(description="bird cage", animal=self.jackdaw),
+                Items(description="whistle", animal=self.jackdaw),
+                Items(description="bag of seeds", animal=self.corvid),
+                Items(description="honey", animal=self.tigger),
+            ]
+        )
 
         def filter_items():
             return Items.prepare.filter(animal__species_id=Placeholder("species_id")).order_by("id")
 
-        PreparedStatementController().register_qs("filter_items", filter_items)
-        PreparedStatementController().prepare_qs_stmt("filter_items", force=True)
+        self.psc.register_qs("filter_items", filter_items)
+        self.psc.prepare_qs_stmt("filter_items", force=True)
 
         qs = execute_stmt("filter_items", species_id=self.crow.id)
 
         self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
-        self.assertEqual(len(qs), 3)
-        self.assertEqual(qs[0].description, "bird cage")
-        self.assertEqual(qs[1].description, "whistle")
-        self.assertEqual(qs[2].description, "bag of seeds")
+        self.assertEqual([row.description for row in qs], ["bird cage", "whistle", "bag of seeds"])
 
     def test_related_filter(self):
         """
@@ -128,24 +149,17 @@ class TestORMQueries(TestCase):
         And   the filter is a __ relation
         Then  only the records which match the filter will be returned in a query set
         """
-        Animal.objects.update_or_create(name="Tigger", species=self.tiger)
-        Animal.objects.update_or_create(name="Jack Daw", species=self.crow)
-        Animal.objects.update_or_create(name="C. Orvid", species=self.crow)
-        Animal.objects.update_or_create(name="Koi", species=self.carp)
-
         def filter_animals():
             # Note the use of the double underscore here compared to test_related_id_filter
             return Animal.prepare.filter(species__id=Placeholder("species_id")).order_by("id")
 
-        PreparedStatementController().register_qs("filter_animals", filter_animals)
-        PreparedStatementController().prepare_qs_stmt("filter_animals", force=True)
+        self.psc.register_qs("filter_animals", filter_animals)
+        self.psc.prepare_qs_stmt("filter_animals", force=True)
 
         qs = execute_stmt("filter_animals", species_id=self.crow.id)
 
         self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
-        self.assertEqual(len(qs), 2)
-        self.assertEqual(qs[0].name, "Jack Daw")
-        self.assertEqual(qs[1].name, "C. Orvid")
+        self.assertEqual([row.name for row in qs], ["Jack Daw", "C. Orvid"])
 
     def test_prepare_in(self):
         """
@@ -153,19 +167,24 @@ class TestORMQueries(TestCase):
         And   the filter is a ListPlaceholder
         When  the prepared statement is executed with a keyword argument which is a list for the filter
         Then  only the records which match the filter will be returned in a query set
+        And   the same prepared statement can be executed with lists of any length
         """
 
         def filter_species_in():
             return Species.prepare.filter(id__in=ListPlaceholder("ids")).order_by("id")
 
-        PreparedStatementController().register_qs("filter_species_in", filter_species_in)
-        PreparedStatementController().prepare_qs_stmt("filter_species_in", force=True)
+        self.psc.register_qs("filter_species_in", filter_species_in)
+        self.psc.prepare_qs_stmt("filter_species_in", force=True)
 
         qs = execute_stmt("filter_species_in", ids=[self.carp.id, self.crow.id])
 
-        self.assertEqual(len(qs), 2)
-        self.assertEqual(qs[0].id, self.carp.id)
-        self.assertEqual(qs[1].id, self.crow.id)
+        self.assertEqual([row.id for row in qs], [self.carp.id, self.crow.id])
+
+        qs = execute_stmt("filter_species_in", ids=[self.tiger.id, self.carp.id, self.crow.id])
+        self.assertEqual([row.id for row in qs], [self.tiger.id, self.carp.id, self.crow.id])
+
+        qs = execute_stmt("filter_species_in", ids=[])
+        self.assertEqual(list(qs), [])
 
     def test_prepare_icontains(self):
         """
@@ -177,8 +196,8 @@ class TestORMQueries(TestCase):
         def filter_species_like():
             return Species.prepare.filter(name__icontains=Placeholder("name"))
 
-        PreparedStatementController().register_qs("filter_species_like", filter_species_like)
-        PreparedStatementController().prepare_qs_stmt("filter_species_like", force=True)
+        self.psc.register_qs("filter_species_like", filter_species_like)
+        self.psc.prepare_qs_stmt("filter_species_like", force=True)
 
         qs = execute_stmt("filter_species_like", name="car")
 
@@ -186,6 +205,35 @@ class TestORMQueries(TestCase):
         self.assertTrue(isinstance(qs[0], Species))
         self.assertEqual(qs[0].name, self.carp.name)
 
+    def test_prepare_startswith_endswith(self):
+        """
+        Given an ORM query is prepared with `__startswith` and `__endswith` filters
+        And   the placeholder names start with characters that are also in the placeholder prefix
+        And   the placeholder names contain characters that django escapes in `LIKE` queries
+        When  the prepared statement is executed with keyword arguments for the filters
+        Then  only the records which start and end with the filter values will be returned in a query set
+        And   executing the statement without all of the keyword arguments will raise a ValueError
+        """
+
+        def filter_species_like():
+            return Species.prepare.filter(
+                name__startswith=Placeholder("prefix"), name__endswith=Placeholder("the_suffix")
+            )
+
+        self.psc.register_qs("filter_species_like", filter_species_like)
+        self.psc.prepare_qs_stmt("filter_species_like", force=True)
+
+        qs = execute_stmt("filter_species_like", prefix="Ti", the_suffix="er")
+
+        self.assertEqual(len(qs), 1)
+        self.assertEqual(qs[0].name, self.tiger.name)
+
+        with self.assertRaises(ValueError):
+            execute_stmt("filter_species_like", prefix="Ti")
+
+        with self.assertRaises(ValueError):
+            execute_stmt("filter_species_like")
+
     def test_filter_with_constant(self):
         """
         Given an ORM query is prepared with a filter that has no placeholders
@@ -196,8 +244,8 @@ class TestORMQueries(TestCase):
         def filter_species():
             return Species.prepare.filter(pk=self.crow.pk)
 
-        PreparedStatementController().register_qs("filter_species", filter_species)
-        PreparedStatementController().prepare_qs_stmt("filter_species", force=True)
+        self.psc.register_qs("filter_species", filter_species)
+        self.psc.prepare_qs_stmt("filter_species", force=True)
 
         qs = execute_stmt("filter_species")
 
@@ -213,14 +261,12 @@ class TestORMQueries(TestCase):
         def filter_species():
             return Species.prepare.filter(Q(pk=self.crow.pk) | Q(pk=Placeholder("pk"))).order_by("pk")
 
-        PreparedStatementController().register_qs("filter_species", filter_species)
-        PreparedStatementController().prepare_qs_stmt("filter_species", force=True)
+        self.psc.register_qs("filter_species", filter_species)
+        self.psc.prepare_qs_stmt("filter_species", force=True)
 
         qs = execute_stmt("filter_species", pk=self.tiger.pk)
 
-        self.assertEqual(len(qs), 2)
-        self.assertEqual(qs[0].name, self.tiger.name)
-        self.assertEqual(qs[1].name, self.crow.name)
+        self.assertEqual([row.name for row in qs], [self.tiger.name, self.crow.name])
 
     def test_filter_not_enough_params(self):
         """
@@ -233,8 +279,8 @@ class TestORMQueries(TestCase):
         def filter_species():
             return Species.prepare.filter(Q(pk=self.crow.pk) | Q(pk=Placeholder("pk")))
 
-        PreparedStatementController().register_qs("filter_species", filter_species)
-        PreparedStatementController().prepare_qs_stmt("filter_species", force=True)
+        self.psc.register_qs("filter_species", filter_species)
+        self.psc.prepare_qs_stmt("filter_species", force=True)
 
         # And again with no params
         with self.assertRaises(ValueError) as ctx:
@@ -252,8 +298,8 @@ class TestORMQueries(TestCase):
         def filter_species():
             return Species.prepare.filter(Q(pk=self.crow.pk) | Q(pk=Placeholder("pk")) | Q(pk=Placeholder("pk2")))
 
-        PreparedStatementController().register_qs("filter_species", filter_species)
-        PreparedStatementController().prepare_qs_stmt("filter_species", force=True)
+        self.psc.register_qs("filter_species", filter_species)
+        self.psc.prepare_qs_stmt("filter_species", force=True)
 
         # And again with no params
         with self.assertRaises(ValueError) as ctx:
@@ -271,13 +317,49 @@ class TestORMQueries(TestCase):
         def filter_species():
             return Species.prepare.filter(Q(pk=Placeholder("pk")) | Q(pk=Placeholder("pk")))
 
-        PreparedStatementController().register_qs("filter_species", filter_species)
+        self.psc.register_qs("filter_species", filter_species)
         with self.assertRaises(NameError) as ctx:
-            PreparedStatementController().prepare_qs_stmt("filter_species", force=True)
+            self.psc.prepare_qs_stmt("filter_species", force=True)
         self.assertEqual(
             str(ctx.exception), "Repeated placeholder name: pk. All placeholders in a query must have unique names."
         )
 
+    def test_filter_same_placeholder_name_in_different_queries(self):
+        """
+        Given an ORM query
+        When  two different queries are built from it which each use a placeholder with the same name
+        Then  no error will be raised
+        And   both queries can be prepared and executed
+        """
+        qs = Species.prepare.all()
+        filter_by_name = qs.filter(name=Placeholder("value"))
+        filter_by_pk = qs.filter(pk=Placeholder("value"))
+
+        self.psc.register_qs("filter_by_name", lambda: filter_by_name)
+        self.psc.register_qs("filter_by_pk", lambda: filter_by_pk)
+        self.psc.prepare_qs_stmt("filter_by_name", force=True)
+        self.psc.prepare_qs_stmt("filter_by_pk", force=True)
+
+        self.assertEqual(execute_stmt("filter_by_name", value=self.crow.name)[0].pk, self.crow.pk)
+        self.assertEqual(execute_stmt("filter_by_pk", value=self.crow.pk)[0].name, self.crow.name)
+
+    def test_filter_invalid_lookup_with_placeholder(self):
+        """
+        Given an ORM query is created with a placeholder in a filter that uses a lookup which doesn't exist
+        When  the query is prepared
+        Then  a FieldError will be raised
+        And   the field's get_prep_value function will be restored
+        """
+
+        def filter_species():
+            return Species.prepare.filter(name__not_a_lookup=Placeholder("name"))
+
+        self.psc.register_qs("filter_species", filter_species)
+        with self.assertRaises(FieldError):
+            self.psc.prepare_qs_stmt("filter_species", force=True)
+
+        self.assertEqual(Species._meta.get_field("name").get_prep_value(1), "1")
+
     def test_filter_too_many_params(self):
         """
         Given an ORM query is prepared with a filter that has one or more placeholders
@@ -289,8 +371,8 @@ class TestORMQueries(TestCase):
         def filter_species():
             return Species.prepare.filter(Q(pk=self.crow.pk) | Q(pk=Placeholder("pk"))).order_by("pk")
 
-        PreparedStatementController().register_qs("filter_species", filter_species)
-        PreparedStatementController().prepare_qs_stmt("filter_species", force=True)
+        self.psc.register_qs("filter_species", filter_species)
+        self.psc.prepare_qs_stmt("filter_species", force=True)
 
         with self.assertRaises(ValueError) as ctx:
             qs = execute_stmt("filter_species", pk=1, pk2=2, pk3=3)
@@ -306,8 +388,8 @@ class TestORMQueries(TestCase):
         def get_species():
             return Species.prepare.get(name=Placeholder("name"))
 
-        PreparedStatementController().register_qs("get_species", get_species)
-        PreparedStatementController().prepare_qs_stmt("get_species", force=True)
+        self.psc.register_qs("get_species", get_species)
+        self.psc.prepare_qs_stmt("get_species", force=True)
 
         qs = execute_stmt("get_species", name="Carp")
 
@@ -325,8 +407,8 @@ class TestORMQueries(TestCase):
         def first_species():
             return Species.prepare.first()
 
-        PreparedStatementController().register_qs("first", first_species)
-        PreparedStatementController().prepare_qs_stmt("first", force=True)
+        self.psc.register_qs("first", first_species)
+        self.psc.prepare_qs_stmt("first", force=True)
 
         qs = execute_stmt("first")
 
@@ -344,8 +426,8 @@ class TestORMQueries(TestCase):
         def last_species():
             return Species.prepare.last()
 
-        PreparedStatementController().register_qs("last", last_species)
-        PreparedStatementController().prepare_qs_stmt("last", force=True)
+        self.psc.register_qs("last", last_species)
+        self.psc.prepare_qs_stmt("last", force=True)
 
         qs = execute_stmt("last")
 
@@ -363,8 +445,8 @@ class TestORMQueries(TestCase):
         def count_species():
             return Species.prepare.count()
 
-        PreparedStatementController().register_qs("count", count_species)
-        PreparedStatementController().prepare_qs_stmt("count", force=True)
+        self.psc.register_qs("count", count_species)
+        self.psc.prepare_qs_stmt("count", force=True)
 
         qs = execute_stmt("count")
 
@@ -381,74 +463,50 @@ class TestORMQueries(TestCase):
         def will_fail():
             return Species.prepare.all().prefetch_related("animal_set")
 
-        PreparedStatementController().register_qs("will_fail", will_fail)
+        self.psc.register_qs("will_fail", will_fail)
 
         with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
+            self.psc.prepare_qs_stmt("will_fail", force=True)
 
-    def test_filtering_prepared_stmt_result(self):
+    def test_prepared_stmt_result_methods(self):
         """
         Given an ORM query is prepared
         And   it has been succesfully executed
         When  any of the functions filter(), get(), latest() or earliest() are called on the resulting query set
         Then  a CannotAlterPreparedStatementQuerySet will be raised
-        """
-        PreparedStatementController().register_qs("all_species", lambda: Species.prepare.all())
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
-        qs = execute_stmt("all_species")
-
-        with self.assertRaises(CannotAlterPreparedStatementQuerySet):
-            qs.filter(id=1)
-
-        with self.assertRaises(CannotAlterPreparedStatementQuerySet):
-            qs.get(id=1)
-
-        with self.assertRaises(CannotAlterPreparedStatementQuerySet):
-            qs.latest("id")
-
-        with self.assertRaises(CannotAlterPreparedStatementQuerySet):
-            qs.earliest("id")
-
-    def test_count_prepared_stmt_result(self):
-        """
-        Given an ORM query is prepared
-        And   it has been succesfully executed
+        ---
         When  count() is called on the resulting query set
         Then  the number of rows in the query set is returned
-        """
-        PreparedStatementController().register_qs("all_species", lambda: Species.prepare.all())
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
-        qs = execute_stmt("all_species")
-
-        self.assertEqual(qs.count(), 3)
-
-    def test_first_prepared_stmt_result(self):
-        """
-        Given an ORM query is prepared
-        And   it has been succesfully executed
+        ---
         When  first() is called on the resulting query set
         Then  the first record relative to the ordering of the prepared query is returned as a model instance
-        """
-        PreparedStatementController().register_qs("all_species", lambda: Species.prepare.all().order_by("pk"))
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
-        qs = execute_stmt("all_species")
-
-        first = qs.first()
-        self.assertEqual(first.name, self.tiger.name)
-
-    def test_last_prepared_stmt_result(self):
-        """
-        Given an ORM query is prepared
-        And   it has been succesfully executed
+        ---
         When  last() is called on the resulting query set
         Then  the last record relative to the ordering of the prepared query is returned as a model instance
         """
-        PreparedStatementController().register_qs("all_species", lambda: Species.prepare.all().order_by("pk"))
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
-        qs = execute_stmt("all_species")
+        qs = execute_stmt("species_by_pk")
+
+        with self.subTest("filtering"):
+            with self.assertRaises(CannotAlterPreparedStatementQuerySet):
+                qs.filter(id=1)
+
+            with self.assertRaises(CannotAlterPreparedStatementQuerySet):
+                qs.get(id=1)
+
+            with self.assertRaises(CannotAlterPreparedStatementQuerySet):
+                qs.latest("id")
 
-        last = qs.last()
-        self.assertEqual(last.name, self.crow.name)
+            with self.assertRaises(CannotAlterPreparedStatementQuerySet):
+                qs.earliest("id")
+
+        with self.subTest("count"):
+            self.assertEqual(qs.count(), 3)
+
+        with self.subTest("first"):
+            self.assertEqual(qs.first().name, self.tiger.name)
+
+        with self.subTest("last"):
+            self.assertEqual(qs.last().name, self.crow.name)
 
     def test_prefetch_related_on_result(self):
         """
@@ -458,26 +516,19 @@ class TestORMQueries(TestCase):
         Then  an extra query will be run to prefetvh the related objects
         And   no further queries will be run when the related objects are accessed from the original query set
         """
-        Animal.objects.update_or_create(name="Tony", species=self.tiger)
-        Animal.objects.update_or_create(name="Sheer Kahn", species=self.tiger)
-
-        def qry():
-            return Species.prepare.filter(name=Placeholder("name"))
-
-        PreparedStatementController().register_qs("qry", qry)
-        PreparedStatementController().prepare_qs_stmt("qry", force=True)
-
-        qs = execute_stmt("qry", name="Tiger")
+        Animal.objects.bulk_create(
+            [Animal(name="Tony", species=self.tiger), Animal(name="Sheer Kahn", species=self.tiger)]
+        )
+        qs = execute_stmt("species_by_name", name="Tiger")
 
         # Now add the prefetch related, which should execute one query.
         with self.assertNumQueries(1):
-            qs = qs.prefetch_related("animal_set")
+            qs = qs.prefetch_related(Prefetch("animal_set", queryset=Animal.objects.only("id", "name", "species_id")))
 
         # Access the animals on the tiger species - as they are prefetched no more queries should be run!
         with self.assertNumQueries(0):
             tigers = qs[0].animal_set.all()
-            self.assertEqual(len(tigers), 2)
-            self.assertEqual(set([tigers[0].name, tigers[1].name]), set(["Tony", "Sheer Kahn"]))
+            self.assertEqual({tiger.name for tiger in tigers}, {"Tigger", "Tony", "Sheer Kahn"})
 
     def test_values_on_result(self):
         """
@@ -486,21 +537,11 @@ class TestORMQueries(TestCase):
         And   flat=True
         Then  only the requested values should be returned in a flattened list
         """
-
-        def all_species():
-            return Species.prepare.order_by("pk")
-
-        PreparedStatementController().register_qs("all_species", all_species)
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
-
-        qs = execute_stmt("all_species")
+        qs = execute_stmt("species_by_pk")
         qs = qs.values("name")
 
         self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
-        self.assertEqual(len(qs), 3)
-        self.assertDictEqual(qs[0], {"name": self.tiger.name})
-        self.assertDictEqual(qs[1], {"name": self.carp.name})
-        self.assertDictEqual(qs[2], {"name": self.crow.name})
+        self.assertEqual(list(qs), [{"name": self.tiger.name}, {"name": self.carp.name}, {"name": self.crow.name}])
 
     def test_prepare_values_list(self):
         """
@@ -513,8 +554,8 @@ class TestORMQueries(TestCase):
             return Species.prepare.order_by("pk").values_list("name", flat=True)
 
         with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("all_species", all_species)
-            PreparedStatementController().prepare_qs_stmt("all_species", force=True)
+            self.psc.register_qs("all_species", all_species)
+            self.psc.prepare_qs_stmt("all_species", force=True)
 
     def test_values_list_on_result(self):
         """
@@ -523,21 +564,11 @@ class TestORMQueries(TestCase):
         And   flat=True
         Then  only the requested values should be returned in a flattened list
         """
-
-        def all_species():
-            return Species.prepare.order_by("pk")
-
-        PreparedStatementController().register_qs("all_species", all_species)
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
-
-        qs = execute_stmt("all_species")
+        qs = execute_stmt("species_by_pk")
         qs = qs.values_list("name", flat=True)
 
         self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
-        self.assertEqual(len(qs), 3)
-        self.assertEqual(qs[0], self.tiger.name)
-        self.assertEqual(qs[1], self.carp.name)
-        self.assertEqual(qs[2], self.crow.name)
+        self.assertEqual(list(qs), [self.tiger.name, self.carp.name, self.crow.name])
 
     def test_related_values_list_on_result(self):
         """
@@ -548,22 +579,17 @@ class TestORMQueries(TestCase):
         Then  only the requested values should be returned in a flattened list
         """
 
-        Animal.objects.update_or_create(name="Tony", species=self.tiger)
-        Animal.objects.update_or_create(name="Sheer Kahn", species=self.tiger)
-
         def all_animal_species():
             return Animal.prepare.order_by("pk")
 
-        PreparedStatementController().register_qs("all_animal_species", all_animal_species)
-        PreparedStatementController().prepare_qs_stmt("all_animal_species", force=True)
+        self.psc.register_qs("all_animal_species", all_animal_species)
+        self.psc.prepare_qs_stmt("all_animal_species", force=True)
 
         qs = execute_stmt("all_animal_species")
         qs = qs.values_list("species_id", flat=True)
 
         self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
-        self.assertEqual(len(qs), 2)
-        self.assertEqual(qs[0], self.tiger.id)
-        self.assertEqual(qs[1], self.tiger.id)
+        self.assertEqual(list(qs), [self.tiger.id, self.crow.id, self.crow.id, self.carp.id])
 
     def test_named_values_list_on_result(self):
         """
@@ -572,72 +598,57 @@ class TestORMQueries(TestCase):
         And   named=True
         Then  only the requested values should be returned as a list of named tuples
         """
+        qs = execute_stmt("species_by_pk")
+        qs = qs.values_list("name", named=True)
 
-        def all_species():
-            return Species.prepare.order_by("pk")
+        self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
+        self.assertEqual([row.name for row in qs], [self.tiger.name, self.carp.name, self.crow.name])
 
-        PreparedStatementController().register_qs("all_species", all_species)
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
+    def test_tuple_values_list_on_result(self):
+        """
+        Given an ORM query is prepared and executed
+        When  .values_list() is called on the resulting query set with one or more fields
+        And   neither flat nor named are set
+        Then  the requested values should be returned as a list of tuples
+        """
+        qs = execute_stmt("species_by_pk")
 
-        qs = execute_stmt("all_species")
-        qs = qs.values_list("name", named=True)
+        self.assertEqual(list(qs.values_list("name")), [(self.tiger.name,), (self.carp.name,), (self.crow.name,)])
+        self.assertEqual(
+            list(qs.values_list("id", "name")),
+            [(self.tiger.id, self.tiger.name), (self.carp.id, self.carp.name), (self.crow.id, self.crow.name)],
+        )
 
-        self.assertTrue(isinstance(qs, PreparedStatementQuerySet))
-        self.assertEqual(len(qs), 3)
+        qs = qs.values_list("id", "name", named=True)
+        self.assertEqual(qs[0].id, self.tiger.id)
         self.assertEqual(qs[0].name, self.tiger.name)
-        self.assertEqual(qs[1].name, self.carp.name)
-        self.assertEqual(qs[2].name, self.crow.name)
 
     def test_not_supported_queryset_methods(self):
         """
         Given an ORM query is created using any of aggregate(), in_bulk(), create(), bulk_create(), bulk_update(),
-              get_or_create(), update_or_create(), delete(), update(), exists() or explain()
+              get_or_create(), update_or_create(), delete(), update(), exists(), explain(), iterator() or
+              select_for_update()
         When  the query is prepared
         Then  a PreparedQueryNotSupported error will be raised
         """
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.aggregate())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.in_bulk())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.create())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.bulk_create())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.bulk_update())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.get_or_create())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.update_or_create())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.delete())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.update())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.exists())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
-
-        with self.assertRaises(PreparedQueryNotSupported):
-            PreparedStatementController().register_qs("will_fail", lambda: Species.prepare.explain())
-            PreparedStatementController().prepare_qs_stmt("will_fail", force=True)
+        for method in (
+            "aggregate",
+            "in_bulk",
+            "create",
+            "bulk_create",
+            "bulk_update",
+            "get_or_create",
+            "update_or_create",
+            "delete",
+            "update",
+            "exists",
+            "explain",
+            "iterator",
+            "select_for_update",
+        ):
+            with self.subTest(method=method), self.assertRaises(PreparedQueryNotSupported):
+                self.psc.register_qs("will_fail", lambda: getattr(Species.prepare, method)())
+                self.psc.prepare_qs_stmt("will_fail", force=True)
 
     def test_query_in_transaction(self):
         """
@@ -650,8 +661,8 @@ class TestORMQueries(TestCase):
         def all_species():
             return Species.prepare.all()
 
-        PreparedStatementController().register_qs("all_species", all_species)
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
+        self.psc.register_qs("all_species", all_species)
+        self.psc.prepare_qs_stmt("all_species", force=True)
 
         with transaction.atomic():
             qs = execute_stmt("all_species")
@@ -670,11 +681,11 @@ class TestORMQueries(TestCase):
         def all_species():
             return Species.prepare.all()
 
-        PreparedStatementController().register_qs("all_species", all_species)
-        PreparedStatementController().prepare_qs_stmt("all_species", force=True)
+        self.psc.register_qs("all_species", all_species)
+        self.psc.prepare_qs_stmt("all_species", force=True)
 
         # deallocate the query to simulate changing database session
-        PreparedStatementController().prepared_statements["all_species"].deallocate()
+        self.psc.prepared_statements["all_species"].deallocate()
 
         with transaction.atomic():
             qs = execute_stmt("all_species")
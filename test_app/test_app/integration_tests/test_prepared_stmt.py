@@ -1,15 +1,15 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 from unittest.mock import patch
 
-from django.db import connection
+from django.db import connection, transaction
 from django.db.utils import ProgrammingError
-from django.test import TransactionTestCase
+from django.test import TestCase, TransactionTestCase
 
 from dqp.constants import FailureBehaviour
 from dqp.prepared_stmt import dictfetchall, PreparedStatement
 
 
-class TestPreparedStatement(TransactionTestCase):
+class TestPreparedStatement(TestCase):
 
     test_schema = """
     drop table if exists my_table;
@@ -20,28 +20,23 @@ class TestPreparedStatement(TransactionTestCase):
     """
 
     test_data = """
-    insert into my_table(name) values ('dan');
-    insert into my_table(name) values ('ben');
-    insert into my_table(name) values ('gareth');
-    insert into my_table(name) values ('marcin');
+    insert into my_table(name) values ('dan'), ('ben'), ('gareth'), ('marcin');
     """
 
     @classmethod
-    def setUp(cls):
+    def setUpTestData(cls):
         """
-        Create some schema and data in the test database which is used in the following tests.
+        Create some schema and data in the test database which is used in the following tests. They are created once in
+        the class-wide transaction and dropped when it is rolled back at the end of the test class.
         """
         with connection.cursor() as cursor:
-            cursor.execute(cls.test_schema)
-            cursor.execute(cls.test_data)
+            cursor.execute(cls.test_schema + cls.test_data)
 
-    @classmethod
-    def tearDown(cls):
+    def tearDown(self):
         """
-        Clean up after this test suite
+        Prepared statements are not rolled back with the transaction so deallocate the statement used in each test.
         """
-        with connection.cursor() as cursor:
-            cursor.execute("drop table if exists my_table;")
+        PreparedStatement("my_stmt", "").deallocate()
 
     def test_prepare_statement(self):
         """
@@ -112,6 +107,39 @@ class TestPreparedStatement(TransactionTestCase):
         results = ps.execute({"person_name": "jamie"})
         self.assertEqual(results, [])
 
+    def test_execute_many(self):
+        """
+        Given a PreparedStatement object is instantiated with an sql query
+        And   the statement has been prepared
+        When  execute_many() is called with several sets of parameters
+        Then  a list of the results for each set of parameters should be returned
+        """
+        my_qry = "select * from my_table where name like %(person_name)s"
+        ps = PreparedStatement("my_stmt", my_qry)
+        ps.prepare()
+
+        results = ps.execute_many([{"person_name": "dan"}, {"person_name": "jamie"}, {"person_name": "ben"}])
+        expected_results = [[{"id": 1, "name": "dan"}], [], [{"id": 2, "name": "ben"}]]
+        self.assertEqual(results, expected_results)
+
+    def test_execute_without_building(self):
+        """
+        Given a statement has been prepared in the database
+        And   a PreparedStatement object for it exists that has not been built, e.g. because another process using
+              pgbouncer prepared the statement
+        When  execute() or execute_many() is called
+        Then  the statement should be built and the results of the query returned
+        """
+        my_qry = "select * from my_table where id = %s;"
+        PreparedStatement("my_stmt", my_qry).prepare()
+
+        ps = PreparedStatement("my_stmt", my_qry)
+        self.assertIsNone(ps._execute_stmt_b)
+        self.assertEqual(ps.execute([2]), [{"id": 2, "name": "ben"}])
+
+        ps = PreparedStatement("my_stmt", my_qry)
+        self.assertEqual(ps.execute_many([[1], [2]]), [[{"id": 1, "name": "dan"}], [{"id": 2, "name": "ben"}]])
+
     def test_deallocate(self):
         """
         Given a PreparedStatement object exists
@@ -165,6 +193,46 @@ class TestPreparedStatement(TransactionTestCase):
         self.assertEqual(results, expected_results)
         self.assertTrue(ps._check_stmt_is_prepared())
 
+    def test_prep_on_execution_without_catalog_lookup(self):
+        """
+        Given a PreparedStatement object exists
+        And   the statement has been prepared but then deallocated
+        When  execute() is called
+        Then  the statement should be re-prepared and then executed
+        And   pg_prepared_statements should not be queried to find out if the statement is prepared
+        """
+        my_qry = "select * from my_table where id = %s;"
+        ps = PreparedStatement("my_stmt", my_qry)
+        ps.prepare()
+        ps.deallocate()
+
+        with patch.object(PreparedStatement, "_check_stmt_is_prepared") as mock_check:
+            results = ps.execute([2])
+        mock_check.assert_not_called()
+
+        self.assertEqual(results, [{"id": 2, "name": "ben"}])
+        self.assertTrue(ps._check_stmt_is_prepared())
+
+    def test_prep_on_execution_in_transaction(self):
+        """
+        Given a PreparedStatement object exists
+        And   the statement has been prepared but then deallocated
+        When  execute() is called inside a transaction
+        Then  the statement should be re-prepared and then executed
+        And   the transaction should still be usable afterwards
+        """
+        ps = PreparedStatement("my_stmt", "select count(*) from my_table;")
+        ps.prepare()
+        ps.deallocate()
+
+        with transaction.atomic():
+            results = ps.execute()
+            self.assertEqual(results, [{"count": 4}])
+
+            with connection.cursor() as cursor:
+                cursor.execute("select count(*) from my_table;")
+                self.assertEqual(cursor.fetchone()[0], 4)
+
     def test_no_error_if_already_prepared_in_db(self):
         """
         Given a PreparedStatement object exists
@@ -270,4 +338,63 @@ class TestPreparedStatement(TransactionTestCase):
         self.assertTrue(ps._check_stmt_is_prepared())
 
         results = ps.execute([1])
-        self.assertEqual(results, [{'count': 1}])
\ No newline at end of file
+        self.assertEqual(results, [{'count': 1}])
+
+    def test_dictfetchall_batches(self):
+        """
+        Given a query which returns more rows than the dictfetchall batch size
+        When  dictfetchall is called
+        Then  all of the rows should be returned as dicts in order
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("select * from my_table order by id;")
+            results = dictfetchall(cursor, batch_size=3)
+
+        expected_results = [
+            {"id": 1, "name": "dan"},
+            {"id": 2, "name": "ben"},
+            {"id": 3, "name": "gareth"},
+            {"id": 4, "name": "marcin"},
+        ]
+        self.assertEqual(results, expected_results)
+
+
+class TestPreparedStatementAutocommit(TransactionTestCase):
+    """
+    Tests which need to execute statements outside of a transaction so can't be run in a TestCase.
+    """
+
+    @classmethod
+    def setUp(cls):
+        with connection.cursor() as cursor:
+            cursor.execute(TestPreparedStatement.test_schema + TestPreparedStatement.test_data)
+
+    @classmethod
+    def tearDown(cls):
+        PreparedStatement("my_stmt", "").deallocate()
+        with connection.cursor() as cursor:
+            cursor.execute("drop table if exists my_table;")
+
+    def test_execute_savepoint_only_in_transaction(self):
+        """
+        Given a PreparedStatement object has been prepared
+        When  execute() is called outside of a transaction
+        Then  the statement should be executed without creating a savepoint
+        ---
+        Given a PreparedStatement object has been prepared
+        When  execute() is called inside a transaction
+        Then  the statement should be executed in a savepoint
+        """
+        ps = PreparedStatement("my_stmt", "select count(*) from my_table;")
+        ps.prepare()
+
+        with patch("dqp.prepared_stmt.transaction.atomic") as mock_atomic:
+            results = ps.execute()
+        mock_atomic.assert_not_called()
+        self.assertEqual(results, [{"count": 4}])
+
+        with transaction.atomic():
+            with patch("dqp.prepared_stmt.transaction.atomic", wraps=transaction.atomic) as mock_atomic:
+                results = ps.execute()
+        mock_atomic.assert_called_once()
+        self.assertEqual(results, [{"count": 4}])
@@ -7,14 +7,14 @@ from dqp.manager import PreparedStatementManager
 
 # Models used by the tests
 class Species(models.Model):
-    name = models.CharField(max_length=50)
+    name = models.CharField(max_length=50, db_index=True)
 
     objects = models.Manager()
     prepare = PreparedStatementManager()
 
 
 class Animal(models.Model):
-    name = models.CharField(max_length=50)
+    name = models.CharField(max_length=50, db_index=True)
 
     species = models.ForeignKey(Species, on_delete=models.CASCADE)
 
@@ -81,8 +81,11 @@ DATABASES = {
         "NAME": "postgres",
         "USER": "postgres",
         "PASSWORD": "password",
-        "HOST": "db",
-        "PORT": "5432",
+        # Override these to run the tests through a connection pooler such as pgbouncer, see TESTING.md
+        "HOST": os.environ.get("DQP_DB_HOST", "db"),
+        "PORT": os.environ.get("DQP_DB_PORT", "5432"),
+        # Prepared statements only last for the database session so keep the connection open
+        "CONN_MAX_AGE": None,
     }
 }
 
@@ -0,0 +1,62 @@
+# Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
+
+import gc
+from unittest.mock import patch
+
+from django.apps import apps
+from django.test import SimpleTestCase
+
+from dqp.prepared_stmt_controller import PreparedStatementController
+
+
+class TestDQPConfigReady(SimpleTestCase):
+    def setUp(self):
+        self.gc_was_enabled = gc.isenabled()
+
+    def tearDown(self):
+        if self.gc_was_enabled:
+            gc.enable()
+
+    def test_gc_enabled_after_ready(self):
+        """
+        Given the garbage collector is enabled
+        When  ready() is called and the statements are prepared
+        Then  the garbage collector should be disabled while the statements are prepared
+        And   the garbage collector should be enabled again afterwards
+        """
+        gc.enable()
+        gc_enabled = []
+
+        def prepare_all_batched(**kwargs):
+            gc_enabled.append(gc.isenabled())
+
+        with patch.object(PreparedStatementController, "prepare_all_batched", side_effect=prepare_all_batched):
+            apps.get_app_config("dqp").ready()
+
+        self.assertEqual(gc_enabled, [False])
+        self.assertTrue(gc.isenabled())
+
+    def test_gc_enabled_after_ready_fails(self):
+        """
+        Given the garbage collector is enabled
+        When  ready() is called and preparing the statements raises an error
+        Then  the garbage collector should be enabled again
+        """
+        gc.enable()
+        with patch.object(PreparedStatementController, "prepare_all_batched", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                apps.get_app_config("dqp").ready()
+
+        self.assertTrue(gc.isenabled())
+
+    def test_gc_stays_disabled_after_ready(self):
+        """
+        Given the garbage collector is disabled
+        When  ready() is called
+        Then  the garbage collector should still be disabled afterwards
+        """
+        gc.disable()
+        with patch.object(PreparedStatementController, "prepare_all_batched"):
+            apps.get_app_config("dqp").ready()
+
+        self.assertFalse(gc.isenabled())
@@ -0,0 +1,49 @@
+# Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
+
+from django.test import SimpleTestCase
+
+from dqp.constants import Placeholder, ListPlaceholder
+
+
+class TestPlaceholders(SimpleTestCase):
+    def test_placeholder_name(self):
+        """
+        Given a Placeholder or ListPlaceholder
+        When  it is created with a name containing a % symbol
+        Then  a ValueError should be raised
+        """
+        with self.assertRaises(ValueError):
+            Placeholder("bad%name")
+
+        with self.assertRaises(ValueError):
+            ListPlaceholder("bad%name")
+
+    def test_placeholder_name_interned(self):
+        """
+        Given a Placeholder or ListPlaceholder
+        When  it is created with a name built at runtime
+        Then  its name should be the interned string
+        """
+        name = "".join(["species", "_id"])
+
+        self.assertIs(Placeholder(name).name, "species_id")
+        self.assertIs(ListPlaceholder(name).name, "species_id")
+
+    def test_list_placeholder(self):
+        """
+        Given a ListPlaceholder
+        When  it is iterated over or indexed
+        Then  it should behave as a list containing a single Placeholder with the same name
+        """
+        list_placeholder = ListPlaceholder("ids")
+        items = list(list_placeholder)
+
+        self.assertEqual(len(list_placeholder), 1)
+        self.assertEqual(len(items), 1)
+        self.assertTrue(isinstance(items[0], Placeholder))
+        self.assertEqual(items[0].name, "ids")
+        self.assertEqual(list_placeholder[0].name, "ids")
+        self.assertEqual(list_placeholder[-1].name, "ids")
+        self.assertEqual([p.name for p in list_placeholder[:]], ["ids"])
+        with self.assertRaises(IndexError):
+            list_placeholder[1]
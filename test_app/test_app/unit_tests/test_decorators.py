@@ -0,0 +1,78 @@
+# Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
+
+import sys
+
+from django.test import TestCase
+
+from dqp.decorators import _make_stmt_name
+
+
+class TestMakeStmtName(TestCase):
+    def test_make_stmt_name(self):
+        """
+        Given a function
+        When  _make_stmt_name is called
+        Then  the name should be an underscore, a 32 character hex digest, an underscore and the function name
+        And   the name should be interned
+        """
+
+        def my_query():
+            pass
+
+        stmt_name = _make_stmt_name(my_query)
+
+        prefix, digest, func_name = stmt_name.split("_", 2)
+        self.assertEqual(prefix, "")
+        self.assertEqual(len(digest), 32)
+        self.assertEqual(func_name, "my_query")
+        self.assertEqual(_make_stmt_name(my_query), stmt_name)
+        self.assertIs(sys.intern(stmt_name), stmt_name)
+
+    def test_make_stmt_name_bound_method(self):
+        """
+        Given a bound method, which can't have attributes set on it
+        When  _make_stmt_name is called
+        Then  the name should be made from the method's name
+        """
+
+        class Queries:
+            def my_query(self):
+                pass
+
+        stmt_name = _make_stmt_name(Queries().my_query)
+        self.assertTrue(stmt_name.endswith("_my_query"))
+        self.assertEqual(_make_stmt_name(Queries().my_query), stmt_name)
+
+    def test_make_stmt_name_max_length(self):
+        """
+        Given a function with a very long name
+        When  _make_stmt_name is called
+        Then  the name should be no longer than the 63 character limit on postgres identifiers
+        """
+
+        def a_function_with_a_really_long_name_that_goes_on_and_on_and_on():
+            pass
+
+        stmt_name = _make_stmt_name(a_function_with_a_really_long_name_that_goes_on_and_on_and_on)
+        self.assertLessEqual(len(stmt_name), 63)
+
+    def test_make_stmt_name_same_name_different_scope(self):
+        """
+        Given two functions with the same name defined in different scopes
+        When  _make_stmt_name is called for each
+        Then  the names should be different
+        """
+
+        def scope_1():
+            def my_query():
+                pass
+
+            return my_query
+
+        def scope_2():
+            def my_query():
+                pass
+
+            return my_query
+
+        self.assertNotEqual(_make_stmt_name(scope_1()), _make_stmt_name(scope_2()))
@@ -1,5 +1,7 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
+from unittest.mock import patch
+
 from django.test import TestCase
 from psycopg2.errors import ProgrammingError
 
@@ -50,8 +52,9 @@ class TestPreparedStatement(TestCase):
         Then  the `sql` set on a PreparedStatement object should be equal to the given sql query string but with
               all instances of %(Y)s replaced by $X where X is the given parameter number in order
         And   the `num_params` set on a PreparedStatement object should be equal to the number of %(Y)s in the input string
-        And   the `named_placeholders` set on a PreparedStatement object should be a list of the parameter names in the
+        And   the `named_placeholders` set on a PreparedStatement object should be a tuple of the parameter names in the
               order in which they appear in the input string
+        And   repeated parameter names should be the same string object
         """
         input_sql = (
             "select r.id, r.record_name, j.info " +
@@ -64,7 +67,7 @@ class TestPreparedStatement(TestCase):
             "from my_records r, joining_table j " +
             "where r.id < $1 and r.time_created > $2 and j.record_id = $3;"
         )
-        expected_params = ["%(record_id)s", "%(time_created)s", "%(record_id)s"]
+        expected_params = ("%(record_id)s", "%(time_created)s", "%(record_id)s")
 
         ps = PreparedStatement("", input_sql)
         ps._prepare_input_sql()
@@ -72,6 +75,7 @@ class TestPreparedStatement(TestCase):
         self.assertEqual(ps.sql, expected_sql)
         self.assertEqual(ps.num_params, 3)
         self.assertEqual(ps.named_placeholders, expected_params)
+        self.assertIs(ps.named_placeholders[0], ps.named_placeholders[2])
 
     def test_prepare_input_sql_4(self):
         """
@@ -84,6 +88,47 @@ class TestPreparedStatement(TestCase):
         with self.assertRaises(ProgrammingError) as context:
             ps._prepare_input_sql()
 
+        input_sql = "select 1 from a_table where id = %(named_id)s and id <> %s;"
+        ps = PreparedStatement("", input_sql)
+        with self.assertRaises(ProgrammingError) as context:
+            ps._prepare_input_sql()
+
+    def test_prepare_input_sql_5(self):
+        """
+        Given an sql query string with mixed case, string literals, comments and placeholders not separated by spaces
+        When  _prepare_input_sql is called
+        Then  the `sql` set on a PreparedStatement object should keep the case of the input sql
+        And   placeholders in comments should be removed along with the comment
+        And   all other placeholders should be replaced by $X where X is the given parameter number in order
+        """
+        input_sql = "SELECT * FROM my_records -- where id = %s\nWHERE name = 'Dan' AND id IN(%s,%s) ; "
+        expected_sql = "SELECT * FROM my_records \nWHERE name = 'Dan' AND id IN($1,$2);"
+
+        ps = PreparedStatement("", input_sql)
+        ps._prepare_input_sql()
+
+        self.assertEqual(ps.sql, expected_sql)
+        self.assertEqual(ps.num_params, 2)
+        self.assertEqual(ps.named_placeholders, None)
+
+    def test_build(self):
+        """
+        Given a PreparedStatement which has been built
+        When  build is called again
+        Then  the input sql should not be processed again
+        And   the execution statement should not be created again
+        """
+        ps = PreparedStatement("my_qry", "select * from my_records where id = %s;")
+        ps.build()
+        self.assertEqual(ps.sql, "select * from my_records where id = $1;")
+
+        with patch.object(PreparedStatement, "_prepare_input_sql") as mock_prepare_input_sql:
+            with patch.object(PreparedStatement, "_create_exec_stmt") as mock_create_exec_stmt:
+                ps.build()
+        mock_prepare_input_sql.assert_not_called()
+        mock_create_exec_stmt.assert_not_called()
+        self.assertEqual(ps.execute_stmt, "EXECUTE my_qry(%s)")
+
     def test_create_exec_stmt_1(self):
         """
         Given a statement name and no parameters
@@ -95,6 +140,7 @@ class TestPreparedStatement(TestCase):
         self.assertEqual(ps.named_placeholders, None)
         ps._create_exec_stmt()
         self.assertEqual(ps.execute_stmt.lower(), "execute my_qry")
+        self.assertEqual(ps._execute_stmt_b, ps.execute_stmt.encode("utf-8"))
 
     def test_create_exec_stmt_2(self):
         """
@@ -144,3 +190,15 @@ class TestPreparedORMStatement(TestCase):
         modified_sql = PreparedORMStatement._modify_sql(input_sql)
 
         self.assertEqual(modified_sql, expected_sql)
+
+    def test_modify_sql_3(self):
+        """
+        Given an sql query string with IN terms in mixed case and words ending in "in" followed by (%s)
+        When  _modify_sql is called
+        Then  only the IN terms will be replaced by ANY terms
+        """
+        input_sql = "select * from my_table where id iN  (%s) and within(%s) and foo In(%s)"
+        expected_sql = "select * from my_table where id = ANY(%s) and within(%s) and foo = ANY(%s)"
+        modified_sql = PreparedORMStatement._modify_sql(input_sql)
+
+        self.assertEqual(modified_sql, expected_sql)
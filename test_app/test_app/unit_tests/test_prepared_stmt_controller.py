@@ -1,9 +1,12 @@
 # Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
 
+import sys
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
 
+from dqp.constants import FailureBehaviour
 from dqp.exceptions import StatementNotPreparedException, StatementAlreadyPreparedException, StatementNotRegistered
 from dqp.prepared_stmt_controller import PreparedStatementController
 from dqp.prepared_stmt import PreparedStatement, PreparedORMStatement
@@ -11,12 +14,18 @@ from dqp.prepared_stmt import PreparedStatement, PreparedORMStatement
 from test_app.models import Species
 
 
-class TestPreparedStatementController(TestCase):
+class TestPreparedStatementControllerRegistration(SimpleTestCase):
+    """
+    Tests of the controller which never prepare a statement, so don't need the database.
+    """
+
+    psc = PreparedStatementController()
+
     def setUp(self):
-        PreparedStatementController().destroy()
+        self.psc.destroy()
 
     def tearDown(self):
-        PreparedStatementController().destroy()
+        self.psc.destroy()
 
     def test_is_singleton(self):
         """
@@ -33,16 +42,17 @@ class TestPreparedStatementController(TestCase):
         Given a function that returns an SQL string
         When  register_sql is called with that function as one of the arguments
         Then  that function should be added to the sql_generating_functions dict
+        And   the statement name should be interned
         """
 
         def gen_sql():
             pass
 
-        psc = PreparedStatementController()
-        psc.register_sql("gen_sql", gen_sql)
-        self.assertTrue("gen_sql" in psc.sql_generating_functions)
-        self.assertFalse("gen_sql" in psc.qs_generating_functions)
-        self.assertTrue(psc.sql_generating_functions["gen_sql"] is gen_sql)
+        self.psc.register_sql("".join(["gen_", "sql"]), gen_sql)
+        self.assertTrue("gen_sql" in self.psc.sql_generating_functions)
+        self.assertFalse("gen_sql" in self.psc.qs_generating_functions)
+        self.assertTrue(self.psc.sql_generating_functions["gen_sql"] is gen_sql)
+        self.assertTrue(next(iter(self.psc.sql_generating_functions)) is sys.intern("gen_sql"))
 
     def test_register_qs(self):
         """
@@ -54,191 +64,405 @@ class TestPreparedStatementController(TestCase):
         def gen_qs():
             pass
 
-        psc = PreparedStatementController()
-        psc.register_qs("gen_qs", gen_qs)
-        self.assertFalse("gen_qs" in psc.sql_generating_functions)
-        self.assertTrue("gen_qs" in psc.qs_generating_functions)
-        self.assertTrue(psc.qs_generating_functions["gen_qs"] is gen_qs)
+        self.psc.register_qs("gen_qs", gen_qs)
+        self.assertFalse("gen_qs" in self.psc.sql_generating_functions)
+        self.assertTrue("gen_qs" in self.psc.qs_generating_functions)
+        self.assertTrue(self.psc.qs_generating_functions["gen_qs"] is gen_qs)
 
-    def test_prepare_sql_stmt(self):
+    def test_prepare_stmt_unregistered(self):
         """
-        Given a function that generates SQL has been registered with the PreparedStatementController
-        When  prepare_sql_stmt is called
-        Then  a PreparedStatement object should be created
-        And   the PreparedStatement should be added to the prepared_statements dict
-        And   the prepare method of the PreparedStatement will be called
+        Given a function that generates SQL or an ORM query has not been registered with the
+              PreparedStatementController
+        When  prepare_sql_stmt or prepare_qs_stmt is called for that function
+        Then  a StatementNotRegistered error will be raised
         """
-        psc = PreparedStatementController()
-        psc.register_sql("gen_sql", lambda: None)
+        for prepare in (self.psc.prepare_sql_stmt, self.psc.prepare_qs_stmt):
+            with self.subTest(prepare=prepare.__name__):
+                with self.assertRaises(StatementNotRegistered):
+                    prepare("unregistered", force=False)
 
-        with patch.object(PreparedStatement, "prepare", return_value=None) as mock_prepare:
-            psc.prepare_sql_stmt("gen_sql", force=False)
-            self.assertTrue("gen_sql" in psc.prepared_statements)
-            self.assertTrue(isinstance(psc.prepared_statements["gen_sql"], PreparedStatement))
-        mock_prepare.assert_called_once()
-
-    def test_prepare_sql_stmt_force(self):
+    def test_execute_unprepared_stmt(self):
         """
-        Given a SQL statement has already been prepared in the database
-        When  prepare_sql_stmt is called for the same function
-        And   force is False
-        Then  a StatementAlreadyPreparedException error will be raised
-        ---
-        Given a SQL statement has already been prepared in the database
-        When  prepare_sql_stmt is called for the same function
-        And   force is True
-        Then  the existing statement will be deallocated
-        And   the statement will be re-prepared
+        Given a statement has not been prepared in the database
+        When  execute() is called for that statement
+        Then  a StatementNotPreparedException error will be raised
         """
-        psc = PreparedStatementController()
-        psc.register_sql("gen_sql", lambda: None)
+        self.assertFalse("gen_sql" in self.psc.prepared_statements)
 
-        with patch.object(PreparedStatement, "prepare", return_value=None):
-            psc.prepare_sql_stmt("gen_sql", force=False)
-            self.assertTrue("gen_sql" in psc.prepared_statements)
+        with self.assertRaises(StatementNotPreparedException):
+            self.psc.execute("gen_qs", force=False)
 
-        with self.assertRaises(StatementAlreadyPreparedException):
-            psc.prepare_sql_stmt("gen_sql", force=False)
 
-        with patch.object(PreparedStatement, "prepare", return_value=None) as mock_prepare:
-            with patch.object(PreparedStatement, "deallocate", return_value=None) as mock_deallocate:
-                psc.prepare_sql_stmt("gen_sql", force=True)
-        mock_deallocate.assert_called_once()
-        mock_prepare.assert_called_once()
+class TestPreparedStatementController(TestCase):
 
-    def test_prepare_sql_stmt_unregistered(self):
-        """
-        Given a function that generates SQL has not been registered with the PreparedStatementController
-        When  prepare_sql_stmt is called for that function
-        Then  a StatementNotRegistered error will be raised
-        """
-        psc = PreparedStatementController()
-        with self.assertRaises(StatementNotRegistered):
-            psc.prepare_sql_stmt("unregistered_sql", force=False)
+    psc = PreparedStatementController()
 
-    def test_prepare_qs_stmt(self):
-        """
-        Given a function that generates an ORM query has been registered with the PreparedStatementController
-        When  prepare_qs_stmt is called
-        Then  a PreparedORMStatement object should be created
-        And   the PreparedORMStatement should be added to the prepared_statements dict
-        And   the SQL will be preapred in the database
-        """
-        psc = PreparedStatementController()
-        psc.register_qs("gen_qs", lambda: Species.prepare.all())
+    def setUp(self):
+        self.psc.destroy()
 
-        with patch.object(PreparedORMStatement, "prepare", return_value=None) as mock_prepare:
-            psc.prepare_qs_stmt("gen_qs", force=False)
-            self.assertTrue("gen_qs" in psc.prepared_statements)
-            self.assertTrue(isinstance(psc.prepared_statements["gen_qs"], PreparedORMStatement))
-        mock_prepare.assert_called_once()
+    def tearDown(self):
+        self.psc.destroy()
 
-    def test_prepare_qs_stmt_force(self):
+    def test_prepare_stmt(self):
         """
-        Given an ORM statement has already been prepared in the database
-        When  prepare_qs_stmt is called for the same function
+        Given a function that generates SQL or an ORM query has been registered with the PreparedStatementController
+        When  prepare_sql_stmt or prepare_qs_stmt is called
+        Then  a PreparedStatement or PreparedORMStatement object should be created
+        And   the statement should be added to the prepared_statements dict
+        And   the prepare method of the statement will be called
+        """
+        cases = [
+            (self.psc.register_sql, self.psc.prepare_sql_stmt, PreparedStatement, lambda: None),
+            (self.psc.register_qs, self.psc.prepare_qs_stmt, PreparedORMStatement, lambda: Species.prepare.all()),
+        ]
+        for register, prepare, stmt_class, gen in cases:
+            with self.subTest(stmt_class=stmt_class.__name__):
+                register("gen", gen)
+
+                with patch.object(stmt_class, "prepare", return_value=None) as mock_prepare:
+                    prepare("gen", force=False)
+                    self.assertTrue(type(self.psc.prepared_statements["gen"]) is stmt_class)
+                mock_prepare.assert_called_once()
+
+                self.psc.destroy()
+
+    def test_prepare_stmt_force(self):
+        """
+        Given a SQL or ORM statement has already been prepared in the database
+        When  prepare_sql_stmt or prepare_qs_stmt is called for the same function
         And   force is False
         Then  a StatementAlreadyPreparedException error will be raised
         ---
-        Given an ORM statement has already been prepared in the database
-        When  prepare_qs_stmt is called for the same function
+        Given a SQL or ORM statement has already been prepared in the database
+        When  prepare_sql_stmt or prepare_qs_stmt is called for the same function
         And   force is True
-        Then  the existing statement will be deallocated
+        Then  the existing statement will not be deallocated as its SQL is unchanged
         And   the statement will be re-prepared
+        ---
+        Given a SQL or ORM statement has already been prepared in the database
+        When  a different function is registered with the same name
+        And   prepare_sql_stmt or prepare_qs_stmt is called with force set to True
+        Then  the existing statement will be deallocated
+        And   the new statement will be prepared
+        """
+        cases = [
+            (
+                self.psc.register_sql,
+                self.psc.prepare_sql_stmt,
+                PreparedStatement,
+                lambda: None,
+                lambda: "select 2;",
+            ),
+            (
+                self.psc.register_qs,
+                self.psc.prepare_qs_stmt,
+                PreparedORMStatement,
+                lambda: Species.prepare.all(),
+                lambda: Species.prepare.filter(name="Tiger"),
+            ),
+        ]
+        for register, prepare, stmt_class, gen, other_gen in cases:
+            with self.subTest(stmt_class=stmt_class.__name__):
+                register("gen", gen)
+
+                with patch.object(stmt_class, "prepare", return_value=None):
+                    prepare("gen", force=False)
+                    self.assertTrue("gen" in self.psc.prepared_statements)
+
+                with self.assertRaises(StatementAlreadyPreparedException):
+                    prepare("gen", force=False)
+
+                stmt = self.psc.prepared_statements["gen"]
+                with patch.object(stmt_class, "prepare", return_value=None) as mock_prepare:
+                    with patch.object(stmt_class, "deallocate", return_value=None) as mock_deallocate:
+                        prepare("gen", force=True)
+                mock_deallocate.assert_not_called()
+                mock_prepare.assert_called_once()
+                self.assertTrue(self.psc.prepared_statements["gen"] is stmt)
+
+                register("gen", other_gen)
+                with patch.object(stmt_class, "prepare", return_value=None) as mock_prepare:
+                    with patch.object(stmt_class, "deallocate", return_value=None) as mock_deallocate:
+                        prepare("gen", force=True)
+                mock_deallocate.assert_called_once()
+                mock_prepare.assert_called_once()
+                self.assertFalse(self.psc.prepared_statements["gen"] is stmt)
+
+                self.psc.destroy()
+
+    def test_prepare_sql_stmt_same_sql(self):
         """
-        psc = PreparedStatementController()
-        psc.register_qs("gen_qs", lambda: Species.prepare.all())
+        Given two functions that generate the same SQL have been registered with the PreparedStatementController
+        When  prepare_sql_stmt is called for each of them
+        Then  they should share the same PreparedStatement
+        And   the shared statement should only be deallocated once neither function uses it
+        """
+        self.psc.register_sql("gen_sql1", lambda: "select 1;")
+        self.psc.register_sql("gen_sql2", lambda: "select 1;")
 
-        with patch.object(PreparedORMStatement, "prepare", return_value=None):
-            psc.prepare_qs_stmt("gen_qs", force=False)
-            self.assertTrue("gen_qs" in psc.prepared_statements)
+        self.psc.prepare_sql_stmt("gen_sql1", force=False)
+        self.psc.prepare_sql_stmt("gen_sql2", force=False)
+        self.assertTrue(self.psc.prepared_statements["gen_sql1"] is self.psc.prepared_statements["gen_sql2"])
+        self.assertEqual(self.psc.execute("gen_sql2"), [{"?column?": 1}])
 
-        with self.assertRaises(StatementAlreadyPreparedException):
-            psc.prepare_qs_stmt("gen_qs", force=False)
+        stmt = self.psc.prepared_statements["gen_sql1"]
+        with patch.object(PreparedStatement, "deallocate", return_value=None) as mock_deallocate:
+            self.psc._remove_prepared_stmt("gen_sql1", force=True)
+            mock_deallocate.assert_not_called()
+            self.psc._remove_prepared_stmt("gen_sql2", force=True)
+            mock_deallocate.assert_called_once()
 
-        with patch.object(PreparedORMStatement, "prepare", return_value=None) as mock_prepare:
-            with patch.object(PreparedORMStatement, "deallocate", return_value=None) as mock_deallocate:
-                psc.prepare_qs_stmt("gen_qs", force=True)
-        mock_deallocate.assert_called_once()
-        mock_prepare.assert_called_once()
+        # The controller has forgotten the statement so it must be deallocated here
+        stmt.deallocate()
 
-    def test_prepare_qs_stmt_unregistered(self):
+    def test_prepare_stmt_reuses_generated_sql(self):
         """
-        Given a function that generates an ORM query has not been registered with the PreparedStatementController
-        When  prepare_sql_stmt is called for that function
-        Then  a StatementNotRegistered error will be raised
+        Given an SQL generating function and an ORM generating function have been registered with the
+              PreparedStatementController
+        When  all of the statements are prepared
+        And   all of the statements are deallocated and then re-prepared
+        Then  each generating function will only have been called once
+        And   the same statement objects will be prepared again
         """
-        psc = PreparedStatementController()
-        with self.assertRaises(StatementNotRegistered):
-            psc.prepare_qs_stmt("unregistered_qs", force=False)
+        calls = []
+
+        def gen_sql():
+            calls.append("gen_sql")
+            return "select 1;"
+
+        def gen_qs():
+            calls.append("gen_qs")
+            return Species.prepare.all()
+
+        self.psc.register_sql("gen_sql", gen_sql)
+        self.psc.register_qs("gen_qs", gen_qs)
+
+        self.psc.prepare_all()
+        stmts = dict(self.psc.prepared_statements)
+        self.psc.deallocate_all()
+        self.psc.prepare_all()
+
+        self.assertEqual(calls, ["gen_sql", "gen_qs"])
+        self.assertTrue(self.psc.prepared_statements["gen_sql"] is stmts["gen_sql"])
+        self.assertTrue(self.psc.prepared_statements["gen_qs"] is stmts["gen_qs"])
+        self.assertEqual(self.psc.execute("gen_sql"), [{"?column?": 1}])
 
     def test_prepare_all(self):
         """
         Given a set of sql and qs generating functions that have been registered with the PreparedStatementController
         When  prepare_all() is called
         Then  prepare_sql_stmt and prepare_qs_stmt should be called for each registered function as appropriate
+        And   every statement should be prepared using the same cursor
         """
-        psc = PreparedStatementController()
-        psc.register_sql("gen_sql1", lambda: None)
-        psc.register_sql("gen_sql2", lambda: None)
-        psc.register_sql("gen_sql3", lambda: None)
-        psc.register_qs("gen_qs1", lambda: Species.prepare.all())
-        psc.register_qs("gen_qs2", lambda: Species.prepare.all())
+        self.psc.register_sql("gen_sql1", lambda: "select 1;")
+        self.psc.register_sql("gen_sql2", lambda: "select 2;")
+        self.psc.register_sql("gen_sql3", lambda: "select 3;")
+        self.psc.register_qs("gen_qs1", lambda: Species.prepare.all())
+        self.psc.register_qs("gen_qs2", lambda: Species.prepare.all())
 
         with patch.object(PreparedORMStatement, "prepare", return_value=None) as mock_orm_prepare:
             with patch.object(PreparedStatement, "prepare", return_value=None) as mock_sql_prepare:
-                psc.prepare_all()
+                self.psc.prepare_all()
         self.assertEqual(mock_sql_prepare.call_count, 3)
         self.assertEqual(mock_orm_prepare.call_count, 2)
 
+        cursors = {c[0][1] for c in mock_sql_prepare.call_args_list + mock_orm_prepare.call_args_list}
+        self.assertEqual(len(cursors), 1)
+        self.assertIsNotNone(cursors.pop())
+
+    def test_prepare_all_batched(self):
+        """
+        Given a set of sql and qs generating functions that have been registered with the PreparedStatementController
+        When  prepare_all_batched() is called
+        Then  all of the statements should be prepared in the database
+        And   the statements should not be prepared one at a time
+        """
+        self.psc.register_sql("gen_sql1", lambda: "select 1;")
+        self.psc.register_sql("gen_sql2", lambda: "select %s;")
+        self.psc.register_sql("gen_sql3", lambda: "select 3;")
+        self.psc.register_qs("gen_qs1", lambda: Species.prepare.all())
+
+        with patch.object(PreparedStatement, "prepare", return_value=None) as mock_prepare:
+            self.psc.prepare_all_batched(batch_size=2)
+        mock_prepare.assert_not_called()
+
+        self.assertEqual(set(self.psc.prepared_statements.keys()), {"gen_sql1", "gen_sql2", "gen_sql3", "gen_qs1"})
+        for stmt in self.psc.prepared_statements.values():
+            self.assertTrue(stmt._check_stmt_is_prepared())
+
+    def test_prepare_all_batched_twice(self):
+        """
+        Given a set of sql generating functions that have been prepared with prepare_all_batched()
+        When  prepare_all_batched() is called again
+        Then  the statements which are already prepared should not be prepared again
+        And   the only query should be the lookup of the statements which are already prepared
+        """
+        self.psc.register_sql("gen_sql1", lambda: "select 1;")
+        self.psc.register_sql("gen_sql2", lambda: "select 2;")
+        self.psc.register_sql("gen_sql3", lambda: "select 3;")
+        self.psc.prepare_all_batched()
+
+        with patch.object(PreparedStatement, "prepare", return_value=None) as mock_prepare:
+            with self.assertNumQueries(1):
+                self.psc.prepare_all_batched()
+        mock_prepare.assert_not_called()
+
+        for stmt in self.psc.prepared_statements.values():
+            self.assertTrue(stmt._check_stmt_is_prepared())
+
+    def test_prepare_all_batched_already_prepared_in_db(self):
+        """
+        Given a statement has already been prepared in the database session, e.g. by another process using pgbouncer
+        When  prepare_all_batched() is called for a new PreparedStatement with the same name
+        Then  the statement should not be prepared again
+        And   the statement should be built so it can be executed
+        """
+        PreparedStatement("gen_sql", "select 1;").prepare()
+        self.psc.register_sql("gen_sql", lambda: "select 1;")
+
+        self.psc.prepare_all_batched()
+
+        self.assertEqual(self.psc.execute("gen_sql"), [{"?column?": 1}])
+
+    def test_prepare_all_batched_failure(self):
+        """
+        Given a set of sql generating functions that have been registered with the PreparedStatementController
+        And   one of the functions generates invalid sql
+        When  prepare_all_batched() is called with on_fail=FailureBehaviour.WARN
+        Then  each statement in the failed batch should be prepared individually
+        And   all of the valid statements should be prepared in the database
+        """
+        self.psc.register_sql("gen_sql1", lambda: "select 1;")
+        self.psc.register_sql("gen_sql2", lambda: "select * from not_a_table;")
+        self.psc.register_sql("gen_sql3", lambda: "select 3;")
+
+        with patch("dqp.prepared_stmt.logger.warning") as mock_logger:
+            self.psc.prepare_all_batched(on_fail=FailureBehaviour.WARN)
+        mock_logger.assert_called_once()
+
+        self.assertTrue(self.psc.prepared_statements["gen_sql1"]._check_stmt_is_prepared())
+        self.assertFalse(self.psc.prepared_statements["gen_sql2"]._check_stmt_is_prepared())
+        self.assertTrue(self.psc.prepared_statements["gen_sql3"]._check_stmt_is_prepared())
+
+    def test_reprepare_all(self):
+        """
+        Given statements have been prepared
+        And   the statements are no longer prepared in the database session
+        When  reprepare_all() is called
+        Then  all of the statements will be prepared in the database again
+        And   the functions that generate the statements will not be called again
+        """
+        calls = []
+
+        def gen_sql():
+            calls.append("gen_sql")
+            return "select 1;"
+
+        self.psc.register_sql("gen_sql", gen_sql)
+        self.psc.register_qs("gen_qs", lambda: Species.prepare.all())
+        self.psc.prepare_all()
+
+        with connection.cursor() as cursor:
+            cursor.execute("DEALLOCATE ALL;")
+
+        self.psc.reprepare_all()
+
+        with connection.cursor() as cursor:
+            cursor.execute("select count(*) from pg_prepared_statements;")
+            (count,) = cursor.fetchone()
+        self.assertEqual(count, 2)
+        self.assertEqual(calls, ["gen_sql"])
+
     def test_execute_prepared_stmt(self):
         """
         Given a statement has been prepared in the database
         When  execute() is called for that statement
         Then  then the execute method of the PreparedStatement object will be called
         """
-        psc = PreparedStatementController()
-        psc.register_sql("gen_sql", lambda: None)
+        self.psc.register_sql("gen_sql", lambda: None)
 
         with patch.object(PreparedStatement, "prepare", return_value=None):
-            psc.prepare_sql_stmt("gen_sql", force=False)
-            self.assertTrue("gen_sql" in psc.prepared_statements)
+            self.psc.prepare_sql_stmt("gen_sql", force=False)
+            self.assertTrue("gen_sql" in self.psc.prepared_statements)
 
         with patch.object(PreparedStatement, "execute", return_value=None) as mock_execute:
-            psc.execute("gen_sql")
+            self.psc.execute("gen_sql")
         mock_execute.assert_called_once()
 
-    def test_execute_unprepared_stmt(self):
+    def test_prepare_lazily(self):
         """
-        Given a statement has not been prepared in the database
-        When  execute() is called for that statement
-        Then  a StatementNotPreparedException error will be raised
+        Given an SQL generating function and an ORM generating function have been registered with the
+              PreparedStatementController
+        When  prepare_all is called with lazy=True
+        Then  neither function will be called and no statement will be prepared
+        ---
+        Given the statements have been marked to be prepared lazily
+        When  a statement is executed
+        Then  only that statement will be generated and prepared
+        And   the statement will be executed
         """
-        psc = PreparedStatementController()
-        self.assertFalse("gen_sql" in psc.prepared_statements)
+        calls = []
 
-        with self.assertRaises(StatementNotPreparedException):
-            psc.execute("gen_qs", force=False)
+        def gen_sql():
+            calls.append("gen_sql")
+            return "select 1;"
+
+        def gen_qs():
+            calls.append("gen_qs")
+            return Species.prepare.all()
+
+        self.psc.register_sql("gen_sql", gen_sql)
+        self.psc.register_qs("gen_qs", gen_qs)
+
+        self.psc.prepare_all(lazy=True)
+        self.assertEqual(calls, [])
+        self.assertEqual(self.psc.prepared_statements, {})
+
+        self.assertEqual(self.psc.execute("gen_sql"), [{"?column?": 1}])
+        self.assertEqual(calls, ["gen_sql"])
+        self.assertTrue("gen_sql" in self.psc.prepared_statements)
+        self.assertFalse("gen_qs" in self.psc.prepared_statements)
+
+        with self.assertRaises(StatementAlreadyPreparedException):
+            self.psc.prepare_sql_stmt("gen_sql", force=False, lazy=True)
 
     def test_deallocate_all(self):
         """
         Given there are prepared statements
         When  deallocate_all() is called
-        Then  the deallocate method will be called on every PreparedStatement object
+        Then  all of the statements will be deallocated in the database
+        And   the statements will be deallocated in a single round trip after finding which are prepared
         And   the prepared_statements dict will be empty
         """
-        psc = PreparedStatementController()
-        psc.register_sql("gen_sql", lambda: None)
-        psc.register_sql("gen_sql2", lambda: None)
-        psc.register_sql("gen_sql3", lambda: None)
+        self.psc.register_sql("gen_sql", lambda: "select 1;")
+        self.psc.register_sql("gen_sql2", lambda: "select 2;")
+        self.psc.register_sql("gen_sql3", lambda: "select 3;")
+        self.psc.prepare_all()
 
-        with patch.object(PreparedStatement, "prepare", return_value=None):
-            psc.prepare_sql_stmt("gen_sql", force=False)
-            psc.prepare_sql_stmt("gen_sql2", force=False)
-            psc.prepare_sql_stmt("gen_sql3", force=False)
+        with self.assertNumQueries(2):
+            self.psc.deallocate_all()
 
-        with patch.object(PreparedStatement, "deallocate", return_value=None) as mock_deallocate:
-            psc.deallocate_all()
-        self.assertEqual(mock_deallocate.call_count, 3)
+        with connection.cursor() as cursor:
+            cursor.execute("select count(*) from pg_prepared_statements;")
+            (count,) = cursor.fetchone()
+        self.assertEqual(count, 0)
+        self.assertEqual(self.psc.prepared_statements, {})
+
+    def test_prepare_sql_stmt_reregister_shared_name(self):
+        """
+        Given two functions that generate the same SQL have been registered and prepared
+        When  the first function's name is registered again with a function that generates different SQL
+        And   prepare_sql_stmt is called for that name with force set to True
+        Then  executing that name should run the new SQL
+        And   executing the other name should still run the shared SQL
+        """
+        self.psc.register_sql("gen_sql1", lambda: "select 1 as v;")
+        self.psc.register_sql("gen_sql2", lambda: "select 1 as v;")
+        self.psc.prepare_sql_stmt("gen_sql1", force=False)
+        self.psc.prepare_sql_stmt("gen_sql2", force=False)
+
+        self.psc.register_sql("gen_sql1", lambda: "select 2 as v;")
+        self.psc.prepare_sql_stmt("gen_sql1", force=True)
 
-        self.assertEqual(psc.prepared_statements, {})
+        self.assertEqual(self.psc.execute("gen_sql1"), [{"v": 2}])
+        self.assertEqual(self.psc.execute("gen_sql2"), [{"v": 1}])
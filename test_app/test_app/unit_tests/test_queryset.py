@@ -0,0 +1,24 @@
+# Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
+
+from django.test import TestCase
+
+from dqp.constants import Placeholder, ListPlaceholder
+
+from test_app.models import Species
+
+
+class TestPreparedQuerySqlBuilder(TestCase):
+    def test_repr(self):
+        """
+        Given a queryset built using the PreparedStatementManager which filters on a Placeholder and a ListPlaceholder
+        When  repr is called on it
+        Then  the SQL should be returned with %s in place of each placeholder
+        And   constant parameters should be filled in
+        """
+        qs = Species.prepare.filter(name=Placeholder("name"), id__in=ListPlaceholder("ids"), id__gt=1)
+        self.assertEqual(
+            repr(qs),
+            'SELECT "test_app_species"."id", "test_app_species"."name" FROM "test_app_species" '
+            'WHERE ("test_app_species"."id" > 1 AND "test_app_species"."id" IN (%s) '
+            'AND "test_app_species"."name" = %s)',
+        )
@@ -0,0 +1,42 @@
+# Copyright (c) 2020, Vercer Ltd. Rights set out in LICENCE.txt
+
+from django.db import connection
+from django.test import TestCase
+
+from dqp.prepared_stmt_controller import PreparedStatementController
+from dqp.testing import prepare_all
+
+
+class TestPrepareAll(TestCase):
+    def setUp(self):
+        PreparedStatementController().destroy()
+
+    def tearDown(self):
+        PreparedStatementController().destroy()
+
+    def test_prepare_all(self):
+        """
+        Given a statement has been prepared and executed
+        When  prepare_all() is called
+        Then  the statement will be deallocated in the database
+        And   when the statement is executed it will be prepared again without regenerating the SQL
+        """
+        calls = []
+
+        def gen_sql():
+            calls.append("gen_sql")
+            return "select 1;"
+
+        psc = PreparedStatementController()
+        psc.register_sql("gen_sql", gen_sql)
+        psc.prepare_sql_stmt("gen_sql", force=False)
+
+        prepare_all()
+
+        with connection.cursor() as cursor:
+            cursor.execute("select count(*) from pg_prepared_statements where name = 'gen_sql';")
+            (count,) = cursor.fetchone()
+        self.assertEqual(count, 0)
+
+        self.assertEqual(psc.execute("gen_sql"), [{"?column?": 1}])
+        self.assertEqual(calls, ["gen_sql"])